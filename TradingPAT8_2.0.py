@@ -1,41 +1,2402 @@
+import time
+# 冷啟動計時起點：放在其他 import 之前，numpy / webview / PIL 的載入時間也算進去
+STARTED_AT = time.time()
 import os
 import sys
 import json
 import base64
+import bisect
 import csv
-import time
+import cProfile
+import functools
+import hashlib
+import inspect
+import io
+import itertools
+import pstats
+import re
+import secrets
+import shutil
+import mimetypes
+import sqlite3
+import threading
+import multiprocessing
+import zipfile
+import numpy as np
 import webview
-from datetime import datetime
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote
+from PIL import Image, features
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    # 選用：只有欄式匯出 (Parquet / Arrow) 需要
+    pa = None
+
+# 前端資源 (HTML / CSS / JS / Chart.js) 隨程式打包；PyInstaller 執行時解到 sys._MEIPASS
+def resource_path(*parts):
+    base = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base, *parts)
+
+ASSET_DIR = resource_path("assets")
+
+JSON_SEPARATORS = re.compile(r'[\s,]*')
+
+# 截斷的 JSON 陣列 (寫到一半當機)：逐筆解析，保留壞掉之前的元素；回傳 (元素, 是否完整)
+def parse_json_array_prefix(text):
+    try:
+        return json.loads(text), True
+    except ValueError:
+        pass
+    decoder = json.JSONDecoder()
+    items = []
+    pos = text.find('[')
+    if pos < 0:
+        return items, False
+    pos += 1
+    while True:
+        pos = JSON_SEPARATORS.match(text, pos).end()
+        try:
+            item, pos = decoder.raw_decode(text, pos)
+        except ValueError:
+            return items, False
+        items.append(item)
+
+# 舊版資料：trades.json 快照 + trades.log.jsonl 追加日誌，只在一次性遷移時讀取
+# 回傳 (交易, 是否完整讀取)；讀不完整時盡量保留解析得出來的交易。沒有 id 的交易依位置補上固定的 id
+def read_legacy_journal(snapshot_file, log_file):
+    trades = OrderedDict()
+    complete = True
+    def keep(trade, fallback_id):
+        if isinstance(trade, dict):
+            if trade.get('id') is None:
+                trade = dict(trade, id=fallback_id)
+            trades[trade['id']] = trade
+    if os.path.exists(snapshot_file):
+        try:
+            with open(snapshot_file, 'r', encoding='utf-8', errors='replace') as f:
+                items, complete = parse_json_array_prefix(f.read())
+        except OSError:
+            items, complete = [], False
+        for i, t in enumerate(items if isinstance(items, list) else []):
+            keep(t, f"legacy-{i}")
+    if os.path.exists(log_file):
+        with open(log_file, 'rb') as f:
+            for n, line in enumerate(f):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 寫到一半當機留下的殘行，略過
+                    continue
+                op = entry.get('op')
+                if op in ('add', 'update'):
+                    keep(entry.get('trade'), f"legacy-log-{n}")
+                elif op == 'delete':
+                    trades.pop(entry.get('id'), None)
+    return list(trades.values()), complete
+
+# 全文檢索斷詞：英數字依單字 (轉小寫)；中日韓文字沒有空白分詞，每段連續的 CJK 字元先依序產生
+# 二元組 (bigram)，再接單字 (unigram)。查詢時多字詞以相鄰的二元組片語比對，效果等同子字串；
+# 單一字則比對單字。斷好的結果以空白串接交給 FTS5 (unicode61) 建索引
+CJK_RUN = re.compile(r'([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]+)')
+WORD = re.compile(r'[^\W_]+')
+
+def _term_tokens(text, for_query):
+    tokens = []
+    for i, part in enumerate(CJK_RUN.split(text)):
+        if i % 2 == 0:
+            tokens.extend(w.lower() for w in WORD.findall(part))
+        elif len(part) == 1:
+            tokens.append(part)
+        else:
+            tokens.extend(part[j:j + 2] for j in range(len(part) - 1))
+            if not for_query:
+                tokens.extend(part)
+    return tokens
+
+def search_tokens(text):
+    return " ".join(_term_tokens(str(text or ""), False))
+
+# 查詢字串 → FTS5 MATCH 運算式：以空白分隔的每個詞都要符合 (AND)，詞內各 token 須相鄰 (片語)，
+# 結尾為英數字時做前綴比對，方便邊打邊搜
+def search_match(query):
+    phrases = []
+    for term in str(query or "").split():
+        tokens = _term_tokens(term, True)
+        if not tokens:
+            continue
+        phrase = " + ".join('"' + t.replace('"', '""') + '"' for t in tokens)
+        if not CJK_RUN.search(tokens[-1]):
+            phrase += "*"
+        phrases.append(phrase)
+    return " AND ".join(phrases)
+
+# 交易資料庫：SQLite (WAL)，常用欄位獨立建索引，完整交易另存於 data 欄 (JSON)
+class TradeStore:
+    INDEXED = ('time', 'method', 'context', 'emotion', 'trade_type', 'result')
+    # 日期區間篩選鍵：值為日期字串，對應 ts 欄位 (寫入時由 time 正規化的 epoch，有索引)
+    RANGE = ('start', 'end')
+    # 全文檢索 (FTS5, contentless)：rowid 對應 trades.seq；斷詞規則改變時遞增版本以重建
+    FTS_VERSION = '1'
+    FTS_WEIGHTS = "bm25(3.0, 2.0, 1.0, 1.0)"
+    # 符合筆數很多時 (常見字)，只在最新的 RANK_POOL 筆裡算 bm25，大日誌也能維持毫秒級
+    RANK_POOL = 10000
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            # id 不宣告型別，前端的數字 id 與字串 id 都照原樣保存
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS trades (
+                    seq INTEGER PRIMARY KEY,
+                    id UNIQUE NOT NULL,
+                    time TEXT, method TEXT, context TEXT, emotion TEXT,
+                    trade_type TEXT, result TEXT, r_value REAL, img TEXT,
+                    data TEXT NOT NULL)""")
+            for col in self.INDEXED:
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_trades_{col} ON trades({col})")
+            # 批次匯入的交易記下匯入批號，方便整批復原
+            if 'import_id' not in [r[1] for r in self.conn.execute("PRAGMA table_info(trades)")]:
+                self.conn.execute("ALTER TABLE trades ADD COLUMN import_id TEXT")
+            # time 是自由格式字串；寫入時另存 epoch，排序與區間查詢都走這欄的索引
+            if 'ts' not in [r[1] for r in self.conn.execute("PRAGMA table_info(trades)")]:
+                self.conn.execute("ALTER TABLE trades ADD COLUMN ts REAL")
+                rows = self.conn.execute("SELECT seq, time FROM trades").fetchall()
+                self.conn.executemany("UPDATE trades SET ts=? WHERE seq=?", ((time_epoch(t), seq) for seq, t in rows))
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_trades_ts ON trades(ts)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_trades_img ON trades(img)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_trades_import_id ON trades(import_id)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            # 圖片引用數，跟交易的增刪在同一個交易 (transaction) 裡更新
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS images (
+                    name TEXT PRIMARY KEY,
+                    size INTEGER,
+                    refcount INTEGER NOT NULL DEFAULT 0)""")
+            # 引用數歸零的時間；垃圾回收只查這欄 (有索引)，不必掃資料夾
+            if 'orphaned' not in [r[1] for r in self.conn.execute("PRAGMA table_info(images)")]:
+                self.conn.execute("ALTER TABLE images ADD COLUMN orphaned REAL")
+                self.conn.execute("UPDATE images SET orphaned=? WHERE refcount <= 0", (time.time(),))
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_images_orphaned ON images(orphaned)")
+            # 入庫重新編碼後，原始檔名指向新檔名；還在用舊檔名寫入的交易會被改指過去
+            if 'moved_to' not in [r[1] for r in self.conn.execute("PRAGMA table_info(images)")]:
+                self.conn.execute("ALTER TABLE images ADD COLUMN moved_to TEXT")
+            # 變更紀錄：觸發器記下每次寫入/刪除的交易 id；seq 遞增不重用，當作增量備份的位移
+            self.conn.execute("CREATE TABLE IF NOT EXISTS changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, trade_id NOT NULL)")
+            for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+                self.conn.execute(f"CREATE TRIGGER IF NOT EXISTS trades_log_{event.lower()} AFTER {event} ON trades "
+                                  f"BEGIN INSERT INTO changes (trade_id) VALUES ({row}.id); END")
+            # 已進備份的圖片；大小變了 (入庫重新編碼過) 下次要再備一份
+            self.conn.execute("CREATE TABLE IF NOT EXISTS backup_images (name TEXT PRIMARY KEY, size INTEGER, hash TEXT)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_backup_images_hash ON backup_images(hash)")
+        if not self.get_meta('image_refs'):
+            with self.lock, self.conn:
+                self._recount_images()
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('image_refs', '1')")
+        try:
+            with self.conn:
+                self.conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS trades_fts USING fts5("
+                                  "method, context, remark, other, content='', tokenize='unicode61 remove_diacritics 2')")
+            self.fts = True
+        except sqlite3.OperationalError:
+            # SQLite 沒編入 FTS5 時退回 LIKE 掃描
+            self.fts = False
+        if self.fts and self.get_meta('fts_version') != self.FTS_VERSION:
+            with self.lock, self.conn:
+                self._rebuild_fts()
+                self.conn.execute("INSERT INTO trades_fts (trades_fts, rank) VALUES ('rank', ?)", (self.FTS_WEIGHTS,))
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('fts_version', ?)", (self.FTS_VERSION,))
+
+    # 欄位：策略、背景、備註，其餘分類 (情緒、型態、結果) 併成一欄
+    @staticmethod
+    def _fts_row(trade):
+        other = " ".join(str(trade.get(k) or "") for k in ('emotion', 'trade_type', 'result'))
+        return (search_tokens(trade.get('method')), search_tokens(trade.get('context')),
+                search_tokens(trade.get('remark')), search_tokens(other))
+
+    def _index(self, seq, trade):
+        if self.fts:
+            self.conn.execute("INSERT INTO trades_fts (rowid, method, context, remark, other) VALUES (?, ?, ?, ?, ?)",
+                              (seq,) + self._fts_row(trade))
+
+    # contentless 表刪除時要給當初建索引的內容；斷詞是確定性的，由舊交易重算即可
+    def _unindex(self, seq, trade):
+        if self.fts:
+            self.conn.execute("INSERT INTO trades_fts (trades_fts, rowid, method, context, remark, other) "
+                              "VALUES ('delete', ?, ?, ?, ?, ?)", (seq,) + self._fts_row(trade))
+
+    def _rebuild_fts(self):
+        if not self.fts:
+            return
+        self.conn.execute("INSERT INTO trades_fts (trades_fts) VALUES ('delete-all')")
+        rows = self.conn.execute("SELECT seq, data FROM trades")
+        self.conn.executemany("INSERT INTO trades_fts (rowid, method, context, remark, other) VALUES (?, ?, ?, ?, ?)",
+                              ((seq,) + self._fts_row(json.loads(data)) for seq, data in rows))
+
+    def _ref_image(self, name, delta):
+        if not name:
+            return
+        self.conn.execute("INSERT OR IGNORE INTO images (name) VALUES (?)", (name,))
+        self.conn.execute("UPDATE images SET refcount = refcount + ?, orphaned = CASE WHEN refcount + ? > 0 "
+                          "THEN NULL ELSE coalesce(orphaned, ?) END WHERE name=?", (delta, delta, time.time(), name))
+
+    def _recount_images(self):
+        self.conn.execute("INSERT OR IGNORE INTO images (name) SELECT DISTINCT img FROM trades WHERE img != ''")
+        self.conn.execute("UPDATE images SET refcount = (SELECT COUNT(*) FROM trades WHERE trades.img = images.name)")
+        self.conn.execute("UPDATE images SET orphaned = CASE WHEN refcount > 0 THEN NULL "
+                          "ELSE coalesce(orphaned, ?) END", (time.time(),))
+
+    # 剛存進來、還沒被交易引用的圖也算孤兒，但從這一刻起算寬限期
+    def register_image(self, name, size):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO images (name) VALUES (?)", (name,))
+            self.conn.execute("UPDATE images SET size=?, orphaned = CASE WHEN refcount > 0 THEN NULL ELSE ? END "
+                              "WHERE name=?", (size, time.time(), name))
+
+    def image_moved_to(self, name):
+        with self.lock:
+            row = self.conn.execute("SELECT moved_to FROM images WHERE name=?", (name,)).fetchone()
+            return row[0] if row else None
+
+    def _resolve_image(self, trade):
+        if trade.get('img'):
+            row = self.conn.execute("SELECT moved_to FROM images WHERE name=?", (trade['img'],)).fetchone()
+            if row and row[0]:
+                trade['img'] = row[0]
+        return trade
+
+    # 舊檔名的所有引用改指新檔 (欄位、JSON 與引用數在同一個交易)；回傳 [(舊交易, 新交易)]
+    def move_image(self, old, new):
+        changed = []
+        with self.lock, self.conn:
+            rows = self.conn.execute("SELECT seq, data FROM trades WHERE img=?", (old,)).fetchall()
+            for seq, data in rows:
+                before = json.loads(data)
+                after = dict(before, img=new)
+                self.conn.execute("UPDATE trades SET img=?, data=? WHERE seq=?",
+                                  (new, json.dumps(after, ensure_ascii=False), seq))
+                changed.append((before, after))
+            if rows:
+                self._ref_image(new, len(rows))
+                self._ref_image(old, -len(rows))
+            self.conn.execute("UPDATE images SET moved_to=? WHERE name=?", (new, old))
+        return changed
+
+    def forget_image(self, name):
+        with self.lock, self.conn:
+            return self.conn.execute("DELETE FROM images WHERE name=? AND refcount <= 0", (name,)).rowcount > 0
+
+    # 一次性盤點：資料夾裡有、表裡沒有的檔案 (引用數制度之前就遺留的) 登記為孤兒；缺大小的補上
+    def track_images(self, entries):
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO images (name, size, orphaned) VALUES (?, ?, ?)",
+                                  ((name, size, now) for name, size in entries))
+            self.conn.executemany("UPDATE images SET size=? WHERE name=? AND size IS NULL",
+                                  ((size, name) for name, size in entries))
+
+    def orphaned_images(self, before, limit=500):
+        with self.lock:
+            return self.conn.execute("SELECT name, size FROM images WHERE orphaned <= ? ORDER BY orphaned LIMIT ?",
+                                     (before, limit)).fetchall()
+
+    def unsized_images(self, limit=500):
+        with self.lock:
+            return [r[0] for r in self.conn.execute("SELECT name FROM images WHERE size IS NULL LIMIT ?", (limit,))]
+
+    # 磁碟用量：全部由 images 表與 trades 表計算；同一張圖被不同月份/策略的交易引用時各算一次
+    def storage_report(self):
+        month = "coalesce(strftime('%Y-%m', t.ts, 'unixepoch', 'localtime'), '')"
+        with self.lock:
+            total = self.conn.execute("SELECT COUNT(*), coalesce(SUM(size), 0), "
+                                      "SUM(refcount > 0), coalesce(SUM(CASE WHEN refcount > 0 THEN size END), 0), "
+                                      "SUM(size IS NULL) FROM images").fetchone()
+            def grouped(key):
+                return [{"key": k, "images": n, "bytes": b or 0} for k, n, b in self.conn.execute(
+                    f"SELECT k, COUNT(*), SUM(size) FROM (SELECT DISTINCT {key} AS k, i.name, i.size "
+                    f"FROM trades t JOIN images i ON i.name = t.img) GROUP BY k ORDER BY k")]
+            return {
+                "images": total[0], "bytes": total[1],
+                "referenced": total[2] or 0, "referencedBytes": total[3],
+                "orphaned": total[0] - (total[2] or 0), "orphanedBytes": total[1] - total[3],
+                "unsized": total[4] or 0,
+                "byMonth": grouped(month),
+                "byMethod": grouped("coalesce(t.method, '')"),
+            }
+
+    def image_refcount(self, name):
+        with self.lock:
+            row = self.conn.execute("SELECT refcount FROM images WHERE name=?", (name,)).fetchone()
+            return row[0] if row else 0
+
+    # 舊版平面檔名 (不含 "/") 的圖片 → 引用它的交易
+    def legacy_image_refs(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT img, id FROM trades WHERE img != '' AND instr(img, '/') = 0 ORDER BY img").fetchall()
+        refs = OrderedDict()
+        for img, trade_id in rows:
+            refs.setdefault(img, []).append(trade_id)
+        return refs
+
+    # 備份讀取用的快照連線，見 StoreSnapshot
+    def read_snapshot(self):
+        return StoreSnapshot(self.db_file)
+
+    def backed_up(self, digest):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM backup_images WHERE hash=? LIMIT 1", (digest,)).fetchone() is not None
+
+    # 快照檔寫好後才記帳：登記已備份的圖片、丟掉已涵蓋的變更紀錄；完整快照先清掉舊的登記
+    def commit_backup(self, log_end, images, last, full=False):
+        with self.lock, self.conn:
+            if full:
+                self.conn.execute("DELETE FROM backup_images")
+            self.conn.executemany("INSERT OR REPLACE INTO backup_images (name, size, hash) VALUES (?, ?, ?)", images)
+            self.conn.execute("DELETE FROM changes WHERE seq <= ?", (log_end,))
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('backup_last', ?)", (last,))
+
+    def get_meta(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+            return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    @staticmethod
+    def _row(trade):
+        return (trade.get('time'), trade.get('method'), trade.get('context'), trade.get('emotion'),
+                trade.get('trade_type'), trade.get('result'), trade.get('rValue'), trade.get('img'),
+                json.dumps(trade, ensure_ascii=False), time_epoch(trade.get('time')))
+
+    # 只接受白名單欄位，值可為單一值或清單；"q" 為全文檢索字串，"start"/"end" 為日期區間
+    def _where(self, filters):
+        clauses, params = [], []
+        filters = dict(filters or {})
+        lo, hi = time_bounds(filters.pop('start', None), filters.pop('end', None))
+        if lo is not None:
+            clauses.append("ts >= ?")
+            params.append(lo)
+        if hi is not None:
+            clauses.append("ts < ?")
+            params.append(hi)
+        for col, val in filters.items():
+            if col == 'q':
+                match = search_match(val)
+                if not match:
+                    continue
+                if self.fts:
+                    clauses.append("seq IN (SELECT rowid FROM trades_fts WHERE trades_fts MATCH ?)")
+                    params.append(match)
+                else:
+                    for term in str(val).split():
+                        clauses.append("data LIKE ?")
+                        params.append(f"%{term}%")
+                continue
+            if col not in self.INDEXED:
+                raise ValueError(f"unknown filter: {col}")
+            if isinstance(val, list):
+                clauses.append(f"{col} IN ({','.join('?' * len(val))})")
+                params.extend(val)
+            else:
+                clauses.append(f"{col} = ?")
+                params.append(val)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    # 依 seq 分批讀取，每批只持鎖一下；大量資料時記憶體只有一批的量
+    def iter_all(self, batch=1000):
+        last = -1
+        while True:
+            with self.lock:
+                rows = self.conn.execute("SELECT seq, data FROM trades WHERE seq > ? ORDER BY seq LIMIT ?",
+                                         (last, batch)).fetchall()
+            if not rows:
+                return
+            for seq, data in rows:
+                yield json.loads(data)
+            last = rows[-1][0]
+
+    def all(self):
+        return list(self.iter_all())
+
+    def get(self, trade_id):
+        with self.lock:
+            row = self.conn.execute("SELECT data FROM trades WHERE id=?", (trade_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # 排序鍵對應到欄位；seq 為寫入順序
+    SORTABLE = {'seq': 'seq', 'time': 'ts', 'rValue': 'r_value', 'method': 'method',
+                'context': 'context', 'result': 'result'}
+
+    def query(self, offset=0, limit=50, filters=None, sort='-seq'):
+        desc = sort.startswith('-')
+        key = sort.lstrip('-')
+        if key not in self.SORTABLE:
+            raise ValueError(f"unknown sort: {sort}")
+        order = f"{self.SORTABLE[key]} {'DESC' if desc else 'ASC'}, seq {'DESC' if desc else 'ASC'}"
+        where, params = self._where(filters)
+        with self.lock:
+            total = self.conn.execute(f"SELECT COUNT(*) FROM trades{where}", params).fetchone()[0]
+            rows = self.conn.execute(f"SELECT data FROM trades{where} ORDER BY {order} LIMIT ? OFFSET ?",
+                                     params + [limit, offset]).fetchall()
+        return total, [json.loads(r[0]) for r in rows]
+
+    def count(self, filters=None):
+        where, params = self._where(filters)
+        with self.lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM trades{where}", params).fetchone()[0]
+
+    # 依 bm25 排序 (策略 > 背景 > 備註 = 其他)，同分較新的在前；回傳 (符合筆數, 前 limit 筆)
+    # 依 rowid 走訪 doclist 很快，bm25 則要逐筆計分，所以先以 rowid 找出候選範圍的下界
+    def search(self, query, limit=50):
+        match = search_match(query)
+        if not match:
+            return 0, []
+        if not self.fts:
+            return self.query(0, limit, {'q': query})
+        with self.lock:
+            total = self.conn.execute("SELECT COUNT(*) FROM trades_fts WHERE trades_fts MATCH ?", (match,)).fetchone()[0]
+            floor = 0
+            if total > self.RANK_POOL:
+                floor = self.conn.execute("SELECT rowid FROM trades_fts WHERE trades_fts MATCH ? ORDER BY rowid DESC "
+                                          "LIMIT 1 OFFSET ?", (match, self.RANK_POOL - 1)).fetchone()[0]
+            hits = self.conn.execute("SELECT rowid FROM trades_fts WHERE trades_fts MATCH ? AND rowid >= ? "
+                                     "ORDER BY rank, rowid DESC LIMIT ?", (match, floor, limit)).fetchall()
+            seqs = [h[0] for h in hits]
+            data = dict(self.conn.execute(f"SELECT seq, data FROM trades WHERE seq IN ({','.join('?' * len(seqs))})", seqs))
+        return total, [json.loads(data[seq]) for seq in seqs if seq in data]
+
+    def insert(self, trade):
+        with self.lock, self.conn:
+            self._resolve_image(trade)
+            cur = self.conn.execute(
+                "INSERT INTO trades (id, time, method, context, emotion, trade_type, result, r_value, img, data, ts) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (trade['id'],) + self._row(trade))
+            self._ref_image(trade.get('img'), 1)
+            self._index(cur.lastrowid, trade)
+
+    # 一整批在同一個交易裡寫入；id 已存在的略過，回傳實際寫入的交易
+    def insert_many(self, trades, import_id=None):
+        inserted = []
+        with self.lock, self.conn:
+            for trade in trades:
+                self._resolve_image(trade)
+                cur = self.conn.execute(
+                    "INSERT OR IGNORE INTO trades (id, time, method, context, emotion, trade_type, result, r_value, img, data, ts, import_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (trade['id'],) + self._row(trade) + (import_id,))
+                if cur.rowcount:
+                    self._ref_image(trade.get('img'), 1)
+                    self._index(cur.lastrowid, trade)
+                    inserted.append(trade)
+        return inserted
+
+    # 刪除整批匯入，回傳被刪掉的交易
+    def delete_import(self, import_id):
+        with self.lock, self.conn:
+            rows = self.conn.execute("SELECT seq, data FROM trades WHERE import_id=?", (import_id,)).fetchall()
+            removed = []
+            self.conn.execute("DELETE FROM trades WHERE import_id=?", (import_id,))
+            for seq, data in rows:
+                trade = json.loads(data)
+                self._ref_image(trade.get('img'), -1)
+                self._unindex(seq, trade)
+                removed.append(trade)
+        return removed
+
+    # 回傳舊資料；找不到時回傳 None
+    def update(self, trade):
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT seq, data FROM trades WHERE id=?", (trade.get('id'),)).fetchone()
+            if row is None:
+                return None
+            seq, old = row[0], json.loads(row[1])
+            self._resolve_image(trade)
+            self.conn.execute(
+                "UPDATE trades SET time=?, method=?, context=?, emotion=?, trade_type=?, result=?, "
+                "r_value=?, img=?, data=?, ts=? WHERE id=?", self._row(trade) + (trade['id'],))
+            if old.get('img') != trade.get('img'):
+                self._ref_image(old.get('img'), -1)
+                self._ref_image(trade.get('img'), 1)
+            self._unindex(seq, old)
+            self._index(seq, trade)
+            return old
+
+    def delete(self, trade_id):
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT seq, data FROM trades WHERE id=?", (trade_id,)).fetchone()
+            if row is None:
+                return None
+            old = json.loads(row[1])
+            self.conn.execute("DELETE FROM trades WHERE seq=?", (row[0],))
+            self._ref_image(old.get('img'), -1)
+            self._unindex(row[0], old)
+            return old
+
+    def replace_all(self, trades):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM trades")
+            for t in trades:
+                self._resolve_image(t)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO trades (id, time, method, context, emotion, trade_type, result, r_value, img, data, ts) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", ((t['id'],) + self._row(t) for t in trades))
+            self._recount_images()
+            self._rebuild_fts()
+
+    # 一次性遷移：匯入後把舊檔改名保留，不再讀取
+    # 舊檔壞掉 (例如截斷) 時只併入讀得到的交易 (id 已存在的略過)，舊檔原地保留、不標記完成；
+    # 同一份壞檔不重複併入，檔案修好 (大小或時間改變) 後下次啟動再併一次
+    def migrate_legacy(self, snapshot_file, log_file):
+        if self.get_meta('legacy_migrated'):
+            return 0
+        stamp = json.dumps([[os.path.getsize(p), os.path.getmtime(p)] if os.path.exists(p) else None
+                            for p in (snapshot_file, log_file)])
+        if self.get_meta('legacy_partial') == stamp:
+            return 0
+        trades, complete = read_legacy_journal(snapshot_file, log_file)
+        inserted = self.insert_many(trades)
+        with self.lock, self.conn:
+            if complete:
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_migrated', ?)",
+                                  (datetime.now().isoformat(),))
+            else:
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_partial', ?)", (stamp,))
+        if complete:
+            for path in (snapshot_file, log_file):
+                if os.path.exists(path):
+                    os.replace(path, path + ".migrated")
+        return len(inserted)
+
+# 備份讀取：另開連線並開啟讀取交易，WAL 下整份備份讀到的是同一時間點，寫入照常進行
+class StoreSnapshot:
+    def __init__(self, db_file):
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.execute("BEGIN")
+        # 已備份的紀錄會被刪掉，位移取 AUTOINCREMENT 的最大值而不是表裡剩下的
+        row = self.conn.execute("SELECT seq FROM sqlite_sequence WHERE name='changes'").fetchone()
+        self.log_end = row[0] if row else 0
+        self.total = self.conn.execute("SELECT COUNT(*) FROM trades").fetchone()[0]
+
+    # since 為 None 時回傳全部交易；否則只回傳位移之後變動過的交易 (取最新狀態)，
+    # 依 seq 排列；已刪除的回傳 ("del", id, None)
+    def changes(self, since=None):
+        if since is None:
+            for seq, data in self.conn.execute("SELECT seq, data FROM trades ORDER BY seq"):
+                yield "put", seq, data
+            return
+        rows = self.conn.execute(
+            "SELECT c.trade_id, t.seq, t.data FROM (SELECT DISTINCT trade_id FROM changes WHERE seq > ?) c "
+            "LEFT JOIN trades t ON t.id = c.trade_id ORDER BY t.seq", (since,))
+        for trade_id, seq, data in rows:
+            if seq is None:
+                yield "del", trade_id, None
+            else:
+                yield "put", seq, data
+
+    # 引用中且還沒備份 (或備份後大小變了) 的圖片；完整快照則是全部引用中的圖片
+    def images(self, full=False):
+        if full:
+            return self.conn.execute("SELECT name, size FROM images WHERE refcount > 0 ORDER BY name").fetchall()
+        return self.conn.execute(
+            "SELECT i.name, i.size FROM images i LEFT JOIN backup_images b ON b.name = i.name "
+            "WHERE i.refcount > 0 AND (b.name IS NULL OR b.size IS NOT i.size) ORDER BY i.name").fetchall()
+
+    def close(self):
+        self.conn.rollback()
+        self.conn.close()
+
+# 增量備份：backups/snapshot-00003-20240105-213000.zip，內含 manifest.json、trades.jsonl
+# (上一份之後變動的交易)、config.json，以及 images/<sha256> (先前快照沒有的圖片內容，不再壓縮)。
+# 第一份是完整快照；還原時從最近的完整快照沿 parent 往後逐份套用
+class BackupSet:
+    PATTERN = re.compile(r"snapshot-(\d+)-[\d-]+\.zip$")
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def files(self):
+        if not os.path.isdir(self.folder):
+            return {}
+        found = {}
+        for f in os.listdir(self.folder):
+            m = self.PATTERN.match(f)
+            if m:
+                found[int(m.group(1))] = os.path.join(self.folder, f)
+        return found
+
+    def path_for(self, snapshot_id):
+        os.makedirs(self.folder, exist_ok=True)
+        return os.path.join(self.folder, f"snapshot-{snapshot_id:05d}-{datetime.now():%Y%m%d-%H%M%S}.zip")
+
+    @staticmethod
+    def manifest(path):
+        with zipfile.ZipFile(path) as zf:
+            return json.loads(zf.read("manifest.json"))
+
+    def list(self):
+        return [dict(self.manifest(path), file=path, bytes=os.path.getsize(path))
+                for _, path in sorted(self.files().items())]
+
+    # 回傳 [(檔案, manifest)]，由完整快照排到 snapshot_id；中間缺檔就無法還原
+    def chain(self, snapshot_id):
+        files = self.files()
+        chain = []
+        current = snapshot_id
+        while True:
+            if current not in files:
+                raise ValueError(f"找不到快照 #{current}")
+            manifest = self.manifest(files[current])
+            chain.append((files[current], manifest))
+            if manifest["full"]:
+                return chain[::-1]
+            current = manifest["parent"]
+
+# 原子寫檔：寫暫存檔 → fsync → os.replace，當機時只會看到舊檔或新檔，不會有截斷的檔案
+def atomic_write(path, text):
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+# 背景寫入：同一目標在短時間內的多次寫入只保留最後一份，安靜 delay 秒後 (最多等 max_delay)
+# 把所有待寫目標一次寫完。每次 submit 回傳自己的 Future，結果 (或例外) 是涵蓋它的那次寫入的結果；
+# urgent=True 表示呼叫者正在等，不等安靜期，立刻寫出
+class WriteBehind:
+    def __init__(self, delay=0.3, max_delay=2.0):
+        self.delay = delay
+        self.max_delay = max_delay
+        # key → [fn, 等待這個 key 的 Future 們]
+        self.pending = OrderedDict()
+        self.first_at = None
+        self.last_at = None
+        self.urgent = False
+        self.busy = False
+        self.closed = False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self.run, daemon=True, name="write-behind")
+        self.thread.start()
+
+    def submit(self, key, fn, urgent=False):
+        future = Future()
+        with self.cond:
+            entry = self.pending.setdefault(key, [fn, []])
+            entry[0] = fn
+            entry[1].append(future)
+            now = time.monotonic()
+            self.first_at = self.first_at or now
+            self.last_at = now
+            self.urgent = self.urgent or urgent
+            self.cond.notify_all()
+        return future
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.pending:
+                    if self.closed:
+                        return
+                    self.cond.wait()
+                # 防抖：等到一段時間沒有新寫入，或距第一筆已超過 max_delay
+                while not self.urgent:
+                    now = time.monotonic()
+                    due = min(self.last_at + self.delay, self.first_at + self.max_delay)
+                    if now >= due:
+                        break
+                    self.cond.wait(due - now)
+                batch = list(self.pending.values())
+                self.pending = OrderedDict()
+                self.first_at = self.last_at = None
+                self.urgent = False
+                self.busy = True
+            try:
+                for fn, futures in batch:
+                    try:
+                        result = fn()
+                    except Exception as e:
+                        for future in futures:
+                            future.set_exception(e)
+                    else:
+                        for future in futures:
+                            future.set_result(result)
+            finally:
+                with self.cond:
+                    self.busy = False
+                    self.cond.notify_all()
+
+    # 立即寫出所有待寫資料並等待完成
+    def flush(self, timeout=10):
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            if self.pending:
+                self.urgent = True
+                self.cond.notify_all()
+            while self.pending or self.busy:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+        return True
+
+    # 寫出剩下的資料後結束背景執行緒
+    def close(self, timeout=10):
+        self.flush(timeout)
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join(timeout)
+
+# 背景工作：耗時的 Api 操作送進有上限的執行緒池，立即回傳工作 id；進度與結果可輪詢 (get_job)，
+# 也會透過 notify 推送給前端。工作函式收到 Job，定期呼叫 job.report() 回報進度、job.check() 檢查取消
+class JobCancelled(Exception):
+    pass
+
+class Job:
+    PUSH_INTERVAL = 0.25
+
+    def __init__(self, job_id, kind, notify=None):
+        self.id = job_id
+        self.kind = kind
+        self.status = "queued"
+        self.done = 0
+        self.total = None
+        self.message = ""
+        self.info = {}
+        self.result = None
+        self.error = ""
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancelled = threading.Event()
+        self.ended = threading.Event()
+        self.notify = notify
+        self.pushed_at = 0.0
+
+    def report(self, done=None, total=None, message=None, **info):
+        if done is not None: self.done = done
+        if total is not None: self.total = total
+        if message is not None: self.message = message
+        self.info.update(info)
+        # 推送節流：進度事件最多每 PUSH_INTERVAL 秒一次
+        now = time.monotonic()
+        if now - self.pushed_at >= self.PUSH_INTERVAL:
+            self.push()
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise JobCancelled()
+
+    # 等到工作結束 (完成、失敗或取消)；逾時回傳 False
+    def wait(self, timeout=None):
+        return self.ended.wait(timeout)
+
+    def push(self):
+        self.pushed_at = time.monotonic()
+        if self.notify is not None:
+            try:
+                self.notify(self.snapshot())
+            except Exception:
+                pass
+
+    def snapshot(self):
+        return {"id": self.id, "kind": self.kind, "status": self.status, "done": self.done, "total": self.total,
+                "message": self.message, "info": self.info, "result": self.result, "error": self.error,
+                "created": self.created, "started": self.started, "finished": self.finished}
+
+class JobRunner:
+    def __init__(self, max_workers=2, notify=None, keep=50):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.notify = notify
+        self.keep = keep
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, kind, fn, job_id=None):
+        job = Job(job_id or secrets.token_hex(6), kind, self.notify)
+        with self.lock:
+            self.jobs[job.id] = job
+            # 只保留最近 keep 個已結束的工作
+            finished = [j for j in self.jobs.values() if j.finished is not None]
+            for old in finished[:max(0, len(finished) - self.keep)]:
+                del self.jobs[old.id]
+        self.pool.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job, fn):
+        job.started = time.time()
+        try:
+            job.check()
+            job.status = "running"
+            job.push()
+            job.result = fn(job)
+            job.status = "done"
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished = time.time()
+            job.push()
+            job.ended.set()
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return [job.snapshot() for job in self.jobs.values()]
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None or job.finished is not None:
+            return False
+        job.cancelled.set()
+        return True
+
+    def shutdown(self):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            job.cancelled.set()
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+# 常見時間格式統一成前端使用的 YYYY-MM-DDTHH:MM；無法辨識就原樣保留
+TIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y/%m/%d %H:%M:%S", "%Y/%m/%d %H:%M",
+                "%m/%d/%Y %H:%M:%S", "%m/%d/%Y %H:%M", "%Y%m%d %H:%M:%S", "%Y-%m-%d", "%Y/%m/%d")
+
+# 解析成本地時間 (naive datetime)；帶時區的轉成本地時間，與前端 new Date() 的結果一致
+# 同一筆交易會依序經過各個增量檢視，快取讓每筆只解析一次
+def parse_time(value):
+    if value is None or value == "":
+        return None
+    return _parse_time_text(str(value).strip())
+
+@functools.lru_cache(maxsize=4096)
+def _parse_time_text(text):
+    try:
+        dt = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    except ValueError:
+        dt = None
+        for fmt in TIME_FORMATS:
+            try:
+                dt = datetime.strptime(text, fmt)
+                break
+            except ValueError:
+                continue
+    if dt is not None and dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return dt
+
+def time_epoch(value):
+    dt = parse_time(value)
+    return dt.timestamp() if dt else None
+
+# 日期區間 → epoch 的 [lo, hi)；只給日期 (不含時分) 的結束日包含當天整天，空值表示不限
+def time_bounds(start=None, end=None):
+    bounds = []
+    for value, is_end in ((start, False), (end, True)):
+        if value in (None, ""):
+            bounds.append(None)
+            continue
+        dt = parse_time(value)
+        if dt is None:
+            raise ValueError(f"invalid date: {value}")
+        if is_end and len(str(value).strip()) <= 10:
+            dt += timedelta(days=1)
+        bounds.append(dt.timestamp())
+    return tuple(bounds)
+
+def normalize_time(value):
+    if value is None or value == "":
+        return ""
+    dt = parse_time(value)
+    return dt.strftime("%Y-%m-%dT%H:%M") if dt else str(value).strip()
+
+# 逐筆讀取 JSON 陣列或 JSON Lines，不把整個檔案載入記憶體
+def iter_json_records(f, chunk_size=1 << 16):
+    decoder = json.JSONDecoder()
+    buf, pos, eof, started = "", 0, False, False
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(buf):
+            if eof:
+                return
+            buf, pos = f.read(chunk_size), 0
+            eof = not buf
+            continue
+        if not started:
+            started = True
+            if buf[pos] == '[':
+                pos += 1
+                continue
+        if buf[pos] == ']':
+            return
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except ValueError:
+            if eof:
+                raise
+            more = f.read(chunk_size)
+            eof = not more
+            buf, pos = buf[pos:] + more, 0
+            continue
+        yield obj
+        pos = end
+
+# 批次匯入：券商對帳單 / 舊日誌 (CSV、JSON、JSON Lines)，欄位依 mapping 對應到交易欄位
+class TradeImporter:
+    FIELDS = ('id', 'time', 'img', 'context', 'method', 'trade_type', 'emotion', 'result', 'rValue', 'remark')
+    # mapping 沒指定時，依欄位名稱 (不分大小寫) 自動對應
+    ALIASES = {
+        'time': 'time', 'date': 'time', 'datetime': 'time', 'date/time': 'time', 'open time': 'time', 'entry time': 'time',
+        'method': 'method', 'strategy': 'method', 'setup': 'method',
+        'context': 'context', 'market': 'context',
+        'type': 'trade_type', 'trade_type': 'trade_type',
+        'emotion': 'emotion',
+        'result': 'result',
+        'r': 'rValue', 'rvalue': 'rValue', 'r value': 'rValue', 'r multiple': 'rValue', 'r-multiple': 'rValue',
+        'remark': 'remark', 'note': 'remark', 'notes': 'remark', 'comment': 'remark',
+        'id': 'id', 'img': 'img',
+    }
+
+    def __init__(self, path, mapping=None):
+        self.path = path
+        self.mapping = mapping or {}
+        self.total_bytes = os.path.getsize(path)
+        self.bytes_read = 0
+        self.import_id = secrets.token_hex(6)
+        # 內容完全相同的列在檔案裡出現第幾次，讓重複的交易仍各自有 id
+        self.occurrences = Counter()
+
+    def records(self):
+        ext = os.path.splitext(self.path)[1].lower()
+        with open(self.path, 'r', encoding='utf-8-sig', newline='') as f:
+            rows = csv.DictReader(f) if ext == '.csv' else iter_json_records(f)
+            for row in rows:
+                self.bytes_read = f.buffer.tell()
+                yield row
+        self.bytes_read = self.total_bytes
+
+    def target(self, column):
+        if column in self.mapping:
+            return self.mapping[column]
+        return self.ALIASES.get(str(column).strip().lower())
+
+    def to_trade(self, row):
+        trade = {}
+        for column, value in row.items():
+            field = self.target(column)
+            if field in self.FIELDS and value not in (None, ""):
+                trade[field] = value
+        r = float(trade.get('rValue') or 0)
+        trade['rValue'] = r
+        trade['time'] = normalize_time(trade.get('time'))
+        if not trade.get('result'):
+            trade['result'] = '獲利' if r > 0 else ('虧損' if r < 0 else '打平')
+        for field in ('img', 'context', 'method', 'trade_type', 'emotion', 'remark'):
+            trade.setdefault(field, "")
+        if 'id' not in trade:
+            trade['id'] = self.content_id(trade)
+        return trade
+
+    # 沒有 id 欄時由內容 (時間/策略/R/備註) 推出固定的 id，同一份檔案重複匯入會被略過
+    def content_id(self, trade):
+        key = json.dumps([trade['time'], trade['method'], trade['rValue'], trade['remark']], ensure_ascii=False)
+        self.occurrences[key] += 1
+        digest = hashlib.sha1(f"{key}#{self.occurrences[key]}".encode('utf-8')).hexdigest()
+        return f"imp-{digest[:16]}"
+
+    def batches(self, size=2000):
+        batch = []
+        for row in self.records():
+            batch.append(self.to_trade(row))
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+def r_of(trade):
+    try:
+        return float(trade.get('rValue') or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+# 統計引擎：維護累計值，每次新增/刪除只做 O(1) 更新
+class TradeStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.sum_r = 0.0
+        self.gross_win = 0.0
+        self.gross_loss = 0.0
+        self.by_result = Counter()
+
+    def add(self, trade):
+        r = r_of(trade)
+        self.count += 1
+        self.sum_r += r
+        if r > 0: self.gross_win += r
+        elif r < 0: self.gross_loss -= r
+        self.by_result[trade.get('result')] += 1
+
+    def remove(self, trade):
+        r = r_of(trade)
+        self.count -= 1
+        self.sum_r -= r
+        if r > 0: self.gross_win -= r
+        elif r < 0: self.gross_loss += r
+        self.by_result[trade.get('result')] -= 1
+        if self.count == 0:
+            # 清掉浮點累加的殘差
+            self.reset()
+
+    def summary(self, dollar_per_r):
+        wins = self.by_result['獲利']
+        return {
+            "total": self.count,
+            "totalR": self.sum_r,
+            "totalPnL": self.sum_r * dollar_per_r,
+            "wins": wins,
+            "winRate": wins / self.count if self.count else 0,
+            "grossWin": self.gross_win,
+            "grossLoss": self.gross_loss,
+            # 沒有虧損時 PF 為無限大，JSON 無法表示，回傳 null 由前端顯示 ∞
+            "pf": self.gross_win / self.gross_loss if self.gross_loss > 0 else (None if self.gross_win > 0 else 0),
+            "byResult": {k: v for k, v in self.by_result.items() if v},
+        }
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+# 依檔頭判斷圖片格式；新檔名的副檔名由此決定，舊資料的 .jpg 檔實際內容可能是 PNG/WebP/GIF
+IMAGE_SIGNATURES = ((b"\xff\xd8\xff", "image/jpeg"), (b"\x89PNG\r\n\x1a\n", "image/png"),
+                    (b"GIF87a", "image/gif"), (b"GIF89a", "image/gif"), (b"BM", "image/bmp"))
+
+def sniff_image_type(head):
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    for magic, content_type in IMAGE_SIGNATURES:
+        if head.startswith(magic):
+            return content_type
+    return None
+
+IMAGE_EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png", "image/gif": ".gif",
+                    "image/bmp": ".bmp", "image/webp": ".webp"}
+
+def image_extension(path):
+    with open(path, 'rb') as f:
+        return IMAGE_EXTENSIONS.get(sniff_image_type(f.read(16)), ".jpg")
+
+# 圖片庫：以內容 SHA-256 命名並依雜湊前兩碼分資料夾 (ab/ab12….webp)，副檔名依實際格式
+# 同一張圖只存一份，引用數記在資料庫的 images 表
+# 引用數歸零超過寬限期的圖由垃圾回收移到 archive_folder (或直接刪除)
+class ImageStore:
+    ORPHAN_GRACE = 24 * 3600
+    THUMB_SUFFIX = ".thumb.jpg"
+
+    def __init__(self, img_folder, store, archive_folder=None, original_folder=None):
+        self.img_folder = img_folder
+        self.store = store
+        self.archive_folder = archive_folder
+        self.original_folder = original_folder
+
+    @staticmethod
+    def name_for(digest, ext=".jpg"):
+        return f"{digest[:2]}/{digest}{ext}"
+
+    def path_of(self, name):
+        return os.path.join(self.img_folder, *name.split('/'))
+
+    # 入庫重新編碼前保留的原檔：同樣的分片路徑，副檔名換成真實格式 (ab/ab12….png)
+    def original_of(self, name, ext):
+        return os.path.join(self.original_folder, *os.path.splitext(name)[0].split('/')) + ext
+
+    def originals(self, name):
+        if not self.original_folder:
+            return []
+        stem = self.original_of(name, "")
+        folder = os.path.dirname(stem)
+        if not os.path.isdir(folder):
+            return []
+        base = os.path.basename(stem) + "."
+        return [os.path.join(folder, f) for f in os.listdir(folder) if f.startswith(base)]
+
+    def put(self, data):
+        tmp = os.path.join(self.img_folder, f".put.{threading.get_ident()}.tmp")
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        return self.commit_file(tmp, hashlib.sha256(data).hexdigest())
+
+    # 把已寫好的檔案搬進分片資料夾；內容已存在時直接刪掉重複的這份
+    # 檢查存在與登記在同一把鎖內，垃圾回收不會在兩者之間把檔案收走
+    # 同樣內容先前已入庫並重新編碼過時，直接回傳新檔名
+    def commit_file(self, src, digest):
+        name = self.name_for(digest, image_extension(src))
+        path = self.path_of(name)
+        with self.store.lock:
+            moved = self.store.image_moved_to(name)
+            if moved and os.path.exists(self.path_of(moved)):
+                os.remove(src)
+                return moved
+            if os.path.exists(path):
+                os.remove(src)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(src, path)
+            self.store.register_image(name, os.path.getsize(path))
+        return name
+
+    def adopt(self, legacy_path):
+        return self.commit_file(legacy_path, file_sha256(legacy_path))
+
+    # 從備份寫回一張圖：先寫暫存檔，換上時一併登記
+    def restore(self, name, fileobj):
+        path = self.path_of(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            shutil.copyfileobj(fileobj, f)
+        with self.store.lock:
+            os.replace(tmp, path)
+            self.store.register_image(name, os.path.getsize(path))
+
+    # 回收一張孤兒圖 (連同縮圖)；期間又被引用就不動，回傳釋放的位元組數
+    # 已被重新編碼版本取代的原始檔直接刪除，不進封存
+    def collect(self, name, archive=True):
+        path = self.path_of(name)
+        with self.store.lock:
+            archive = archive and not self.store.image_moved_to(name)
+            if not self.store.forget_image(name):
+                return 0
+            size = os.path.getsize(path) if os.path.isfile(path) else 0
+            if size and archive and self.archive_folder:
+                dst = os.path.join(self.archive_folder, *name.split('/'))
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                os.replace(path, dst)
+            elif size:
+                os.remove(path)
+        thumb = os.path.splitext(path)[0] + self.THUMB_SUFFIX
+        if os.path.exists(thumb):
+            os.remove(thumb)
+        for original in self.originals(name):
+            os.remove(original)
+        return size
+
+    # 列出資料夾裡的原圖 (略過縮圖、暫存與上傳中的檔案)：只在第一次盤點時用
+    def walk(self):
+        for root, dirs, files in os.walk(self.img_folder):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            rel = os.path.relpath(root, self.img_folder)
+            for f in files:
+                if f.startswith('.') or f.endswith(self.THUMB_SUFFIX) or f.endswith('.tmp'):
+                    continue
+                name = f if rel == '.' else f"{rel.replace(os.sep, '/')}/{f}"
+                yield name, os.path.getsize(os.path.join(root, f))
+
+# 分段上傳：每段 base64 邊解碼邊寫入暫存檔並累計雜湊，記憶體用量與圖片大小無關
+class ImageUpload:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.hasher = hashlib.sha256()
+        self.pending = ""
+        self.size = 0
+
+    def append(self, chunk):
+        # 不是 4 的倍數的尾巴留到下一段再解
+        buf = self.pending + chunk
+        cut = len(buf) - len(buf) % 4
+        self.pending = buf[cut:]
+        self._write(base64.b64decode(buf[:cut]))
+
+    def _write(self, data):
+        self.file.write(data)
+        self.hasher.update(data)
+        self.size += len(data)
+
+    def finish(self):
+        if self.pending:
+            self._write(base64.b64decode(self.pending + "=" * (-len(self.pending) % 4)))
+        self.file.close()
+        return self.hasher.hexdigest()
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+# 縮圖：存在原圖旁 (<name>.thumb.jpg)，由執行緒池產生；記憶體中以總位元組數為上限做 LRU 快取
+class ThumbnailCache:
+    SUFFIX = ImageStore.THUMB_SUFFIX
+
+    def __init__(self, img_folder, box=(192, 108), max_bytes=16 * 1024 * 1024, workers=2):
+        self.img_folder = img_folder
+        self.box = box
+        self.max_bytes = max_bytes
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumb")
+        self.cache = OrderedDict()
+        self.cached_bytes = 0
+        self.lock = threading.Lock()
+
+    def thumb_name(self, filename):
+        return os.path.splitext(filename)[0] + self.SUFFIX
+
+    def schedule(self, filename):
+        return self.pool.submit(self.build, filename)
+
+    # 已有且比原圖新的縮圖直接沿用；舊資料的縮圖在第一次被請求時才產生
+    def build(self, filename):
+        src = os.path.join(self.img_folder, filename)
+        dst = os.path.join(self.img_folder, self.thumb_name(filename))
+        if os.path.exists(dst) and os.path.getmtime(dst) >= os.path.getmtime(src):
+            return dst
+        with Image.open(src) as img:
+            # JPEG 可在解碼時直接縮小，大圖不必整張解開
+            img.draft('RGB', (self.box[0] * 2, self.box[1] * 2))
+            img.thumbnail(self.box)
+            tmp = dst + ".tmp"
+            img.convert('RGB').save(tmp, 'JPEG', quality=80)
+        os.replace(tmp, dst)
+        return dst
+
+    def get(self, filename):
+        with self.lock:
+            data = self.cache.get(filename)
+            if data is not None:
+                self.cache.move_to_end(filename)
+                return data
+        with open(self.build(filename), 'rb') as f:
+            data = f.read()
+        with self.lock:
+            if filename not in self.cache:
+                self.cache[filename] = data
+                self.cached_bytes += len(data)
+            while self.cached_bytes > self.max_bytes and self.cache:
+                _, old = self.cache.popitem(last=False)
+                self.cached_bytes -= len(old)
+        return data
+
+    def discard(self, filename):
+        with self.lock:
+            data = self.cache.pop(filename, None)
+            if data is not None:
+                self.cached_bytes -= len(data)
+
+# 圖片入庫：原始內容先照雜湊檔名落地 (交易馬上可以存)，再由執行緒池偵測真實格式、
+# 縮到 max_size 以內並以 fmt/quality 重新編碼。新內容以自己的雜湊與副檔名入庫，
+# 再由 on_commit(舊檔名, 新檔名) 把引用改指過去；舊檔成為孤兒，留給垃圾回收
+# 環境變數：TJ_IMAGE_MAX=2560x1600、TJ_IMAGE_FORMAT=webp|jpeg|original、TJ_IMAGE_QUALITY=82、
+# TJ_IMAGE_KEEP_ORIGINAL=1 (原檔另存到 images_original/)
+class ImageIngest:
+    def __init__(self, images, thumbs=None, max_size=(2560, 1600), fmt="WEBP", quality=82,
+                 keep_original=False, workers=2, on_commit=None):
+        self.images = images
+        self.thumbs = thumbs
+        self.on_commit = on_commit or images.store.move_image
+        self.max_size = max_size
+        # 沒編入 WebP 的 Pillow 退回 JPEG
+        self.fmt = None if fmt is None else ("JPEG" if fmt == "WEBP" and not features.check('webp') else fmt)
+        self.quality = quality
+        self.keep_original = keep_original
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+        self.lock = threading.Lock()
+        self.stats = {"images": 0, "recoded": 0, "bytesIn": 0, "bytesOut": 0, "failed": 0}
+        # 已送出但尚未結束的工作 (含排隊中與執行中)；取消的工作也會觸發 done callback
+        self.pending = 0
+
+    @classmethod
+    def from_env(cls, images, thumbs=None, on_commit=None):
+        w, _, h = os.environ.get("TJ_IMAGE_MAX", "2560x1600").lower().partition("x")
+        fmt = os.environ.get("TJ_IMAGE_FORMAT", "webp").upper()
+        return cls(images, thumbs, max_size=(int(w), int(h or w)),
+                   fmt=None if fmt == "ORIGINAL" else fmt,
+                   quality=int(os.environ.get("TJ_IMAGE_QUALITY", "82")),
+                   keep_original=os.environ.get("TJ_IMAGE_KEEP_ORIGINAL", "0") == "1",
+                   on_commit=on_commit)
+
+    def schedule(self, name):
+        with self.lock:
+            self.pending += 1
+        try:
+            future = self.pool.submit(self.run, name)
+        except Exception:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self.lock:
+            self.pending -= 1
+
+    # 處理完 (不論有沒有重新編碼) 才排縮圖，縮圖一定是由最終版本產生；回傳最終檔名
+    def run(self, name):
+        final = name
+        try:
+            final = self.process(name)
+        except Exception:
+            with self.lock:
+                self.stats["failed"] += 1
+        if self.thumbs is not None:
+            self.thumbs.discard(final)
+            self.thumbs.schedule(final)
+        return final
+
+    def process(self, name):
+        path = self.images.path_of(name)
+        size = os.path.getsize(path)
+        with self.lock:
+            self.stats["images"] += 1
+            self.stats["bytesIn"] += size
+        data = self.encode(path)
+        if data is None or len(data) >= size:
+            with self.lock:
+                self.stats["bytesOut"] += size
+            return name
+        tmp = os.path.join(self.images.img_folder, f".ingest.{threading.get_ident()}.tmp")
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        new = self.images.commit_file(tmp, hashlib.sha256(data).hexdigest())
+        if self.keep_original:
+            # 原檔跟著新檔名存 (副檔名為原本的格式)，新圖被回收時一併清掉
+            original = self.images.original_of(new, os.path.splitext(name)[1])
+            os.makedirs(os.path.dirname(original), exist_ok=True)
+            shutil.copyfile(path, original)
+        self.on_commit(name, new)
+        with self.lock:
+            self.stats["recoded"] += 1
+            self.stats["bytesOut"] += len(data)
+        return new
+
+    # 需要縮小，或來源是 PNG/BMP 這類無損大檔時才重新編碼；JPEG/WebP 尺寸合格就不再壓一次
+    def encode(self, path):
+        if self.fmt is None:
+            return None
+        with Image.open(path) as img:
+            if getattr(img, "is_animated", False):
+                return None
+            oversized = img.width > self.max_size[0] or img.height > self.max_size[1]
+            if not oversized and img.format in ("JPEG", "WEBP"):
+                return None
+            if self.fmt == "JPEG" and img.format == "JPEG":
+                img.draft('RGB', self.max_size)
+            img.thumbnail(self.max_size, Image.LANCZOS)
+            alpha = "A" in img.mode or "transparency" in img.info
+            if self.fmt == "JPEG" and alpha:
+                # JPEG 沒有透明度，鋪在白底上
+                rgba = img.convert("RGBA")
+                img = Image.new("RGB", rgba.size, (255, 255, 255))
+                img.paste(rgba, mask=rgba.getchannel("A"))
+            elif img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if alpha else "RGB")
+            options = {"method": 4} if self.fmt == "WEBP" else {"optimize": True}
+            buf = io.BytesIO()
+            img.save(buf, self.fmt, quality=self.quality, **options)
+            return buf.getvalue()
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats, pending=self.pending,
+                        maxSize=list(self.max_size), format=self.fmt or "original", quality=self.quality)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+# 本機媒體伺服器：只綁 127.0.0.1，以 URL 直接串流 images 資料夾的檔案
+# 路徑帶隨機 token，避免其他本機程式或網頁猜到位址就能讀圖
+class MediaHandler(BaseHTTPRequestHandler):
+    def do_HEAD(self):
+        self.serve(head=True)
+
+    def do_GET(self):
+        self.serve(head=False)
+
+    def serve(self, head):
+        media = self.server.media
+        parts = self.path.split('?', 1)[0].lstrip('/').split('/', 2)
+        if len(parts) != 3 or parts[0] != media.token or parts[1] not in media.roots:
+            return self.send_error(404)
+        root = media.roots[parts[1]]
+        filepath = os.path.realpath(os.path.join(root, unquote(parts[2])))
+        if os.path.commonpath([filepath, root]) != root or not os.path.isfile(filepath):
+            return self.send_error(404)
+
+        st = os.stat(filepath)
+        etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        # 縮圖路由：以原圖路徑請求，內容從記憶體 LRU 取出
+        if parts[1] == 'thumbs':
+            try:
+                data = media.thumbs.get(os.path.relpath(filepath, root))
+            except Exception:
+                return self.send_error(404)
+            self.send_headers(etag, st.st_mtime, 'image/jpeg', len(data))
+            if not head:
+                self.wfile.write(data)
+            return
+
+        content_type = mimetypes.guess_type(filepath)[0] or 'application/octet-stream'
+        if parts[1] == 'images':
+            with open(filepath, 'rb') as f:
+                content_type = sniff_image_type(f.read(16)) or content_type
+        if content_type.startswith('text/') or content_type == 'application/javascript':
+            content_type += '; charset=utf-8'
+        self.send_headers(etag, st.st_mtime, content_type, st.st_size)
+        if head:
+            return
+        with open(filepath, 'rb') as f:
+            # socket.sendfile 在支援的平台上走 os.sendfile，不經過 Python 緩衝
+            self.wfile.flush()
+            self.connection.sendfile(f)
+
+    def send_headers(self, etag, mtime, content_type, length):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(length))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', formatdate(mtime, usegmt=True))
+        self.send_header('Cache-Control', 'private, max-age=86400')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+class MediaServer:
+    def __init__(self, roots, thumbs=None):
+        self.roots = {name: os.path.realpath(path) for name, path in roots.items()}
+        self.thumbs = thumbs
+        if thumbs is not None:
+            self.roots['thumbs'] = os.path.realpath(thumbs.img_folder)
+        self.token = secrets.token_urlsafe(16)
+        self.httpd = None
+        self.lock = threading.Lock()
+
+    def base_url(self):
+        with self.lock:
+            if self.httpd is None:
+                self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), MediaHandler)
+                self.httpd.daemon_threads = True
+                self.httpd.media = self
+                threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+            return f"http://127.0.0.1:{self.httpd.server_address[1]}/{self.token}"
+
+    def stop(self):
+        with self.lock:
+            if self.httpd is not None:
+                self.httpd.shutdown()
+                self.httpd.server_close()
+                self.httpd = None
+
+# 欄式資料：rValue、時間 (epoch) 與小時存成 NumPy 陣列，類別欄位存成整數代碼
+# 依寫入順序排列；刪除先標記，死列過半時才壓實
+class TradeColumns:
+    CATEGORIES = ('method', 'context', 'emotion', 'trade_type', 'result')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, capacity=1024):
+        self.size = 0
+        self.dead = 0
+        self.ids = []
+        self.row_of = {}
+        self.r = np.zeros(capacity)
+        self.ts = np.full(capacity, np.nan)
+        self.hour = np.full(capacity, -1, dtype=np.int8)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.codes = {c: np.zeros(capacity, dtype=np.int32) for c in self.CATEGORIES}
+        self.labels = {c: [] for c in self.CATEGORIES}
+        self.label_code = {c: {} for c in self.CATEGORIES}
+        self.version = 0
+        # 依 (時間, 列號) 排序的列索引；列號即寫入順序，時間相同時維持 seq 先後。
+        # 依時間遞增新增時直接附加；補登舊交易、改時間或壓縮後標記 dirty，讀取時才重排一次
+        self.order = np.zeros(capacity, dtype=np.int64)
+        self.order_len = 0
+        self.order_dirty = False
+        self._sequence = (-1, None)
+
+    def _arrays(self):
+        return [self.r, self.ts, self.hour, self.alive] + [self.codes[c] for c in self.CATEGORIES]
+
+    def _grow(self):
+        capacity = len(self.r) * 2
+        self.r, self.ts, self.hour, self.alive, *codes = [np.resize(a, capacity) for a in self._arrays()]
+        self.alive[self.size:] = False
+        self.codes = dict(zip(self.CATEGORIES, codes))
+
+    def _code(self, cat, value):
+        value = value if value is not None else ""
+        code = self.label_code[cat].get(value)
+        if code is None:
+            code = self.label_code[cat][value] = len(self.labels[cat])
+            self.labels[cat].append(value)
+        return code
+
+    # 無法解析的時間排在最後
+    def _ts_key(self, row):
+        ts = self.ts[row]
+        return np.inf if np.isnan(ts) else ts
+
+    def _fill(self, row, trade):
+        dt = parse_time(trade.get('time'))
+        self.r[row] = r_of(trade)
+        self.ts[row] = dt.timestamp() if dt else np.nan
+        self.hour[row] = dt.hour if dt else -1
+        for cat in self.CATEGORIES:
+            self.codes[cat][row] = self._code(cat, trade.get(cat))
+        self.version += 1
+
+    def add(self, trade):
+        if self.size == len(self.r):
+            self._grow()
+        row = self.size
+        self.size += 1
+        self.ids.append(trade.get('id'))
+        self.row_of[trade.get('id')] = row
+        self.alive[row] = True
+        self._fill(row, trade)
+        self._place(row)
+
+    def _place(self, row):
+        if self.order_dirty:
+            return
+        if self.order_len and self._ts_key(row) < self._ts_key(self.order[self.order_len - 1]):
+            self.order_dirty = True
+            return
+        if self.order_len == len(self.order):
+            self.order = np.resize(self.order, max(len(self.order) * 2, 1024))
+        self.order[self.order_len] = row
+        self.order_len += 1
+
+    # 修改時原地覆寫；時間改變才需要重新排序
+    def update(self, old, new):
+        row = self.row_of.get(old.get('id'))
+        if row is None or old.get('id') != new.get('id'):
+            self.remove(old)
+            self.add(new)
+        else:
+            ts = self._ts_key(row)
+            self._fill(row, new)
+            if self._ts_key(row) != ts:
+                self.order_dirty = True
+
+    def remove(self, trade):
+        row = self.row_of.pop(trade.get('id'), None)
+        if row is None:
+            return
+        self.alive[row] = False
+        self.dead += 1
+        self.version += 1
+        if self.dead > 1024 and self.dead * 2 > self.size:
+            self.compact()
+
+    def compact(self):
+        keep = np.flatnonzero(self.alive[:self.size])
+        n = len(keep)
+        for a in self._arrays():
+            a[:n] = a[keep]
+        self.alive[n:] = False
+        self.ids = [self.ids[i] for i in keep]
+        self.row_of = {trade_id: i for i, trade_id in enumerate(self.ids)}
+        self.size = n
+        self.dead = 0
+        self.order_dirty = True
+
+    def mask(self):
+        return self.alive[:self.size]
+
+    # 存活列依交易時間排序的索引；刪除的列在讀取時濾掉
+    def sequence(self):
+        if self._sequence[0] == self.version:
+            return self._sequence[1]
+        if self.order_dirty:
+            rows = np.arange(self.size)
+            ts = self.ts[:self.size]
+            keys = np.where(np.isnan(ts), np.inf, ts)
+            self.order = np.lexsort((rows, keys))
+            self.order_len = self.size
+            self.order_dirty = False
+        order = self.order[:self.order_len]
+        order = order[self.alive[order]]
+        self._sequence = (self.version, order)
+        return order
+
+    def r_series(self):
+        return self.r[self.sequence()]
+
+    # 依類別篩選的 R 序列；filters 例如 {"method": "雙底", "context": [...], "start": "2024-01-01"}
+    def select(self, filters=None):
+        m = self.mask().copy()
+        filters = dict(filters or {})
+        lo, hi = time_bounds(filters.pop('start', None), filters.pop('end', None))
+        ts = self.ts[:self.size]
+        # NaN (無法解析的時間) 比較結果為 False，有日期區間時自然排除
+        if lo is not None:
+            m &= ts >= lo
+        if hi is not None:
+            m &= ts < hi
+        for cat, value in filters.items():
+            if cat not in self.CATEGORIES:
+                raise ValueError(f"unknown filter: {cat}")
+            values = value if isinstance(value, list) else [value]
+            codes = [self.label_code[cat][v] for v in values if v in self.label_code[cat]]
+            m &= np.isin(self.codes[cat][:self.size], codes)
+        order = self.sequence()
+        return self.r[order[m[order]]]
+
+    def equity(self, dollar_per_r):
+        return np.cumsum(self.r_series()) * dollar_per_r
+
+    def hourly_pnl(self, dollar_per_r):
+        m = self.mask()
+        hours = self.hour[:self.size][m]
+        valid = hours >= 0
+        return np.bincount(hours[valid], weights=self.r[:self.size][m][valid], minlength=24) * dollar_per_r
+
+    # 依類別欄位分組加總；只回傳目前有交易的類別
+    def pnl_by(self, cat, dollar_per_r):
+        m = self.mask()
+        codes = self.codes[cat][:self.size][m]
+        n = len(self.labels[cat])
+        sums = np.bincount(codes, weights=self.r[:self.size][m], minlength=n) * dollar_per_r
+        counts = np.bincount(codes, minlength=n)
+        present = np.flatnonzero(counts)
+        return [self.labels[cat][i] for i in present], sums[present]
+
+# LTTB (Largest-Triangle-Three-Buckets) 降採樣：保留曲線形狀，回傳選中的索引
+def lttb_indices(x, y, n_out):
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # 下一個桶的平均點作為三角形第三個頂點
+        nlo, nhi = hi, (edges[i + 2] if i + 2 < len(edges) else n)
+        avg_x, avg_y = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        bx, by = x[lo:hi], y[lo:hi]
+        area = np.abs((x[a] - avg_x) * (by - y[a]) - (x[a] - bx) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+def round_list(values, digits=2):
+    return np.round(values, digits).tolist()
+
+# JSON 不能表示 NaN / ∞，一律轉成 null
+def finite_list(values, digits=4):
+    values = np.round(np.asarray(values, dtype=float), digits)
+    return [v if np.isfinite(v) else None for v in values.tolist()]
+
+def finite(value, digits=4):
+    return round(float(value), digits) if np.isfinite(value) else None
+
+# mask 中最長的連續 True 長度與起點
+def longest_run(mask):
+    if not mask.any():
+        return 0, -1
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    lengths = np.flatnonzero(edges == -1) - starts
+    i = int(lengths.argmax())
+    return int(lengths[i]), int(starts[i])
+
+# 風險指標：對整條 R 序列做一次向量運算
+def risk_metrics(r, window):
+    n = len(r)
+    result = {"count": n, "window": window}
+    if n == 0:
+        return result
+    equity = np.cumsum(r)
+    # 起始資金 0 也算一個高點
+    peak = np.maximum.accumulate(np.maximum(equity, 0))
+    drawdown = peak - equity
+    dd_len, dd_start = longest_run(drawdown > 0)
+    wins, losses = r > 0, r < 0
+    std = r.std(ddof=1) if n > 1 else 0.0
+    mean = r.mean()
+    result.update({
+        "maxDrawdownR": finite(drawdown.max()),
+        "maxDrawdownAt": int(drawdown.argmax()),
+        "currentDrawdownR": finite(drawdown[-1]),
+        "maxDrawdownTrades": dd_len,
+        "maxDrawdownStart": dd_start,
+        "currentDrawdownTrades": int(n - 1 - np.flatnonzero(drawdown == 0)[-1]) if (drawdown == 0).any() else n,
+        "expectancy": finite(mean),
+        "avgWin": finite(r[wins].mean()) if wins.any() else 0,
+        "avgLoss": finite(r[losses].mean()) if losses.any() else 0,
+        "stdR": finite(std),
+        # SQN 依慣例最多取 100 筆計算
+        "sqn": finite(np.sqrt(min(n, 100)) * mean / std) if std > 0 else None,
+        "sharpe": finite(mean / std) if std > 0 else None,
+        "longestWinStreak": longest_run(wins)[0],
+        "longestLossStreak": longest_run(losses)[0],
+    })
+    if window and n >= window:
+        # 滾動視窗用前綴和相減，不逐窗計算
+        def rolling_sum(x):
+            c = np.concatenate(([0.0], np.cumsum(x)))
+            return c[window:] - c[:-window]
+        gross_win = rolling_sum(np.where(wins, r, 0.0))
+        gross_loss = -rolling_sum(np.where(losses, r, 0.0))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pf = np.where(gross_loss > 0, gross_win / gross_loss, np.where(gross_win > 0, np.inf, 0.0))
+        result["rollingWinRate"] = finite_list(rolling_sum(wins.astype(float)) / window)
+        result["rollingPF"] = finite_list(pf)
+    return result
+
+# 樞紐分析：任選 2~3 個維度的所有組合都預先累計 [筆數, 獲利筆數, R 總和]
+# 每筆交易增刪只更新固定數量的格子，切換樞紐時直接讀取
+class PivotCube:
+    DIMS = ('context', 'method', 'emotion', 'trade_type', 'hour', 'weekday')
+
+    def __init__(self):
+        self.combos = [c for n in (1, 2, 3) for c in itertools.combinations(self.DIMS, n)]
+        self.reset()
+
+    def reset(self):
+        self.cells = {combo: {} for combo in self.combos}
+
+    def _values(self, trade):
+        dt = parse_time(trade.get('time'))
+        values = {d: trade.get(d) or "" for d in self.DIMS[:4]}
+        values['hour'] = dt.hour if dt else None
+        values['weekday'] = dt.weekday() if dt else None
+        return values
+
+    def _apply(self, trade, sign):
+        values = self._values(trade)
+        win = sign if trade.get('result') == '獲利' else 0
+        r = r_of(trade) * sign
+        for combo, cells in self.cells.items():
+            key = tuple(values[d] for d in combo)
+            cell = cells.get(key)
+            if cell is None:
+                cell = cells[key] = [0, 0, 0.0]
+            cell[0] += sign
+            cell[1] += win
+            cell[2] += r
+            if cell[0] == 0:
+                del cells[key]
+
+    def add(self, trade):
+        self._apply(trade, 1)
+
+    def remove(self, trade):
+        self._apply(trade, -1)
+
+    # 依呼叫者指定的維度順序回傳每個非空格子
+    def pivot(self, dims):
+        if not 1 <= len(dims) <= 3 or len(set(dims)) != len(dims) or any(d not in self.DIMS for d in dims):
+            raise ValueError(f"invalid dims: {dims}")
+        combo = tuple(sorted(dims, key=self.DIMS.index))
+        order = [combo.index(d) for d in dims]
+        cells = []
+        for key, (count, wins, sum_r) in self.cells[combo].items():
+            cells.append({"key": [key[i] for i in order], "count": count, "wins": wins,
+                          "winRate": wins / count, "avgR": sum_r / count, "sumR": sum_r})
+        return cells
+
+# 日曆：依本地日期累計的日桶 [筆數, 獲利筆數, 虧損筆數, R 合計, 總獲利 R, 總虧損 R]，
+# 日期鍵 (YYYY-MM-DD) 另存排序清單；區間查詢以 bisect 找範圍，週 / 月由日桶彙總
+class CalendarIndex:
+    GRANULARITIES = ('day', 'week', 'month')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.days = {}
+        self.keys = []
+        self.undated = 0
+
+    def _apply(self, trade, sign):
+        dt = parse_time(trade.get('time'))
+        if dt is None:
+            self.undated += sign
+            return
+        key = dt.strftime("%Y-%m-%d")
+        cell = self.days.get(key)
+        if cell is None:
+            cell = self.days[key] = [0, 0, 0, 0.0, 0.0, 0.0]
+            bisect.insort(self.keys, key)
+        r = r_of(trade)
+        result = trade.get('result')
+        cell[0] += sign
+        cell[1] += sign if result == '獲利' else 0
+        cell[2] += sign if result == '虧損' else 0
+        cell[3] += r * sign
+        cell[4] += max(r, 0) * sign
+        cell[5] += max(-r, 0) * sign
+        if cell[0] == 0:
+            del self.days[key]
+            del self.keys[bisect.bisect_left(self.keys, key)]
+
+    def add(self, trade):
+        self._apply(trade, 1)
+
+    def remove(self, trade):
+        self._apply(trade, -1)
+
+    @staticmethod
+    def bucket_of(day, granularity):
+        if granularity == 'day':
+            return day
+        if granularity == 'month':
+            return day[:7]
+        d = datetime.strptime(day, "%Y-%m-%d")
+        return (d - timedelta(days=d.weekday())).strftime("%Y-%m-%d")
+
+    # start / end 為日期字串 (含)，空值表示不限；週以週一為起始
+    def buckets(self, start=None, end=None, granularity='day'):
+        if granularity not in self.GRANULARITIES:
+            raise ValueError(f"unknown granularity: {granularity}")
+        bounds = []
+        for value in (start, end):
+            dt = parse_time(value) if value not in (None, "") else None
+            if value not in (None, "") and dt is None:
+                raise ValueError(f"invalid date: {value}")
+            bounds.append(dt.strftime("%Y-%m-%d") if dt else None)
+        i = bisect.bisect_left(self.keys, bounds[0]) if bounds[0] else 0
+        j = bisect.bisect_right(self.keys, bounds[1]) if bounds[1] else len(self.keys)
+        out = OrderedDict()
+        for day in self.keys[i:j]:
+            key = self.bucket_of(day, granularity)
+            acc = out.get(key)
+            if acc is None:
+                acc = out[key] = [0, 0, 0, 0.0, 0.0, 0.0]
+            for k, v in enumerate(self.days[day]):
+                acc[k] += v
+        return out
+
+# 蒙地卡羅：在子行程中模擬一批路徑 (必須是模組層級函式才能被 pickle)
+# mode="bootstrap" 為放回抽樣，"shuffle" 為把原序列重新排列
+MC_PERCENTILES = (5, 25, 50, 75, 95)
+
+def simulate_chunk(r, n_paths, horizon, mode, seed, band_points=200):
+    rng = np.random.default_rng(seed)
+    if mode == "shuffle":
+        steps = rng.permuted(np.tile(r, (n_paths, 1)), axis=1)
+    else:
+        steps = r[rng.integers(0, len(r), size=(n_paths, horizon))]
+    equity = np.cumsum(steps, axis=1)
+    peak = np.maximum.accumulate(np.maximum(equity, 0), axis=1)
+    max_dd = (peak - equity).max(axis=1)
+    # 分位帶只取最多 band_points 個時間點，傳回量與路徑長度無關
+    cols = np.unique(np.linspace(0, equity.shape[1] - 1, min(band_points, equity.shape[1])).astype(int))
+    band = np.percentile(equity[:, cols], MC_PERCENTILES, axis=0)
+    return equity[:, -1], max_dd, cols, band
+
+class MonteCarloRun:
+    def __init__(self, run_id, r, n_paths, horizon, mode, chunk=2000):
+        self.id = run_id
+        self.r = r
+        self.n_paths = n_paths
+        self.horizon = horizon
+        self.mode = mode
+        self.chunk = chunk
+        self.status = "running"
+        self.error = ""
+        self.done_paths = 0
+        self.endings = []
+        self.max_dds = []
+        self.cols = None
+        self.band_sum = None
+        self.cancelled = threading.Event()
+        self.started = time.time()
+        self.elapsed = 0.0
+        self.lock = threading.Lock()
+
+    def run(self, on_progress=None):
+        # 一律用 spawn：主行程有 webview 與伺服器執行緒，fork 不安全
+        ctx = multiprocessing.get_context("spawn")
+        seeds = np.random.SeedSequence().spawn((self.n_paths + self.chunk - 1) // self.chunk)
+        try:
+            with ProcessPoolExecutor(max_workers=os.cpu_count() or 2, mp_context=ctx) as pool:
+                pending = set()
+                for i, seed in enumerate(seeds):
+                    n = min(self.chunk, self.n_paths - i * self.chunk)
+                    pending.add(pool.submit(simulate_chunk, self.r, n, self.horizon, self.mode, seed))
+                while pending:
+                    done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self.merge(*future.result())
+                    if done and on_progress is not None:
+                        on_progress(self.done_paths, self.n_paths)
+                    if self.cancelled.is_set():
+                        for future in pending:
+                            future.cancel()
+                        self.status = "cancelled"
+                        return
+            self.status = "done"
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+        finally:
+            self.elapsed = time.time() - self.started
+
+    # 各批的分位帶依路徑數加權平均 (近似值，批次夠大時誤差很小)；結束值與回撤保留全部，分位數為精確值
+    def merge(self, endings, max_dd, cols, band):
+        with self.lock:
+            n = len(endings)
+            self.endings.append(endings)
+            self.max_dds.append(max_dd)
+            self.cols = cols
+            self.band_sum = band * n if self.band_sum is None else self.band_sum + band * n
+            self.done_paths += n
+
+    def snapshot(self, dollar_per_r):
+        with self.lock:
+            result = {"id": self.id, "status": self.status, "error": self.error, "paths": self.done_paths,
+                      "totalPaths": self.n_paths, "horizon": self.horizon,
+                      "elapsed": round((self.elapsed or time.time() - self.started), 2)}
+            if self.done_paths:
+                endings = np.concatenate(self.endings)
+                max_dds = np.concatenate(self.max_dds)
+                result.update({
+                    "percentiles": list(MC_PERCENTILES),
+                    "steps": (self.cols + 1).tolist(),
+                    "band": [round_list(row * dollar_per_r) for row in self.band_sum / self.done_paths],
+                    "ending": round_list(np.percentile(endings, MC_PERCENTILES) * dollar_per_r),
+                    "maxDrawdown": round_list(np.percentile(max_dds, MC_PERCENTILES) * dollar_per_r),
+                    "probLoss": round(float((endings < 0).mean()), 4),
+                })
+            return result
+
+# 呼叫量測：每個公開 Api 方法的耗時與參數/回傳字元數，保留最近 window 次做滾動直方圖
+# 環境變數：TJ_METRICS=0 關閉量測；TJ_PROFILE=<檔案> 以 cProfile 剖析每次呼叫，結束時寫出 pstats；
+# TJ_TRACE=<檔案> 寫出 Chrome trace (chrome://tracing / Perfetto 可開)，前端標記也會一起放進去
+class CallMetrics:
+    BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+    MAX_TRACE_EVENTS = 200000
+
+    def __init__(self, window=1024, enabled=True, profile_path=None, trace_path=None):
+        self.window = window
+        self.enabled = enabled
+        self.profile_path = profile_path
+        self.trace_path = trace_path
+        self.lock = threading.Lock()
+        # cProfile 同一時間只能有一個作用中的剖析器，剖析模式下呼叫依序執行；
+        # 巢狀呼叫 (公開方法互相呼叫) 只剖析最外層
+        self.profile_lock = threading.RLock()
+        self.local = threading.local()
+        self.profile_stats = None
+        self.trace = []
+        self.reset()
+
+    @classmethod
+    def from_env(cls):
+        return cls(enabled=os.environ.get("TJ_METRICS", "1") != "0",
+                   profile_path=os.environ.get("TJ_PROFILE") or None,
+                   trace_path=os.environ.get("TJ_TRACE") or None)
+
+    def reset(self):
+        with self.lock:
+            self.series = {}
+            self.since = time.time()
+
+    def call(self, name, fn, args, kwargs):
+        started = time.time()
+        t0 = time.perf_counter()
+        error = False
+        result = None
+        depth = getattr(self.local, 'depth', 0)
+        self.local.depth = depth + 1
+        try:
+            if self.profile_path and depth == 0:
+                with self.profile_lock:
+                    profiler = cProfile.Profile()
+                    try:
+                        result = profiler.runcall(fn, *args, **kwargs)
+                    finally:
+                        self.profile_stats = pstats.Stats(profiler) if self.profile_stats is None else self.profile_stats.add(profiler)
+            else:
+                result = fn(*args, **kwargs)
+            # 本專案的 API 以 "error: ..." 字串回報失敗
+            error = isinstance(result, str) and result.startswith("error")
+            return result
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.local.depth = depth
+            ms = (time.perf_counter() - t0) * 1000
+            chars_in = sum(len(a) for a in itertools.chain(args, kwargs.values()) if isinstance(a, str))
+            chars_out = len(result) if isinstance(result, str) else 0
+            self.record(name, started, ms, chars_in, chars_out, error)
+
+    def record(self, name, started, ms, chars_in=0, chars_out=0, error=False, tid=None):
+        with self.lock:
+            entry = self.series.get(name)
+            if entry is None:
+                entry = self.series[name] = {"calls": 0, "errors": 0, "charsIn": 0, "charsOut": 0,
+                                             "samples": deque(maxlen=self.window)}
+            entry["calls"] += 1
+            entry["errors"] += error
+            entry["charsIn"] += chars_in
+            entry["charsOut"] += chars_out
+            entry["samples"].append(ms)
+            if self.trace_path and len(self.trace) < self.MAX_TRACE_EVENTS:
+                self.trace.append({"name": name, "ph": "X", "ts": round(started * 1e6), "dur": round(ms * 1000),
+                                   "pid": os.getpid(), "tid": threading.get_ident() if tid is None else tid,
+                                   "args": {"charsIn": chars_in, "charsOut": chars_out}})
+
+    def snapshot(self):
+        with self.lock:
+            series = {name: dict(entry, samples=np.array(entry["samples"])) for name, entry in self.series.items()}
+            since = self.since
+        calls = {}
+        for name, entry in sorted(series.items()):
+            ms = entry.pop("samples")
+            counts = np.bincount(np.searchsorted(self.BUCKETS_MS, ms), minlength=len(self.BUCKETS_MS) + 1)
+            entry.update({
+                "p50": finite(np.percentile(ms, 50), 3), "p90": finite(np.percentile(ms, 90), 3),
+                "p99": finite(np.percentile(ms, 99), 3), "max": finite(ms.max(), 3),
+                # 直方圖：每格為 "≤ 上界 ms" 的次數，最後一格是超過最大上界的
+                "histogram": dict(zip([str(b) for b in self.BUCKETS_MS] + ["inf"], counts.tolist())),
+            })
+            calls[name] = entry
+        return {"enabled": self.enabled, "window": self.window, "since": since,
+                "profiling": bool(self.profile_path), "tracing": bool(self.trace_path), "calls": calls}
+
+    def dump(self):
+        if self.profile_path and self.profile_stats is not None:
+            with self.profile_lock:
+                self.profile_stats.dump_stats(self.profile_path)
+        if self.trace_path:
+            with self.lock:
+                events = list(self.trace)
+            events.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": 0, "args": {"name": "webview (JS)"}})
+            atomic_write(self.trace_path, json.dumps({"traceEvents": events}))
+
+# 類別裝飾器：包裝所有公開方法。pywebview 以 inspect.getfullargspec 取參數名稱，
+# 它不追 __wrapped__，所以另外設 __signature__，前端看到的參數與原方法一致
+def instrumented(cls):
+    def wrap(name, fn):
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            metrics = self._metrics
+            if not metrics.enabled:
+                return fn(self, *args, **kwargs)
+            return metrics.call(name, functools.partial(fn, self), args, kwargs)
+        wrapper.__signature__ = inspect.signature(fn)
+        return wrapper
+    for name, attr in list(vars(cls).items()):
+        if not name.startswith('_') and inspect.isfunction(attr):
+            setattr(cls, name, wrap(name, attr))
+    return cls
 
 # API 類別
+@instrumented
 class Api:
     def __init__(self, app_path):
         self.app_path = app_path
         self.data_file = os.path.join(app_path, "trades.json")
+        self.log_file = os.path.join(app_path, "trades.log.jsonl")
+        self.db_file = os.path.join(app_path, "trades.db")
         self.config_file = os.path.join(app_path, "config.json")
         self.img_folder = os.path.join(app_path, "images")
         if not os.path.exists(self.img_folder):
             os.makedirs(self.img_folder)
+        self.startup_log = os.path.join(app_path, "startup.log.jsonl")
+        self._startup = {}
+        self._metrics = CallMetrics.from_env()
+        self._thumbs = ThumbnailCache(self.img_folder)
+        self._media = MediaServer({"images": self.img_folder, "assets": ASSET_DIR}, self._thumbs)
+        self._store = TradeStore(self.db_file)
+        self._store.migrate_legacy(self.data_file, self.log_file)
+        self._images = ImageStore(self.img_folder, self._store, os.path.join(app_path, "images_archive"),
+                                  os.path.join(app_path, "images_original"))
+        self._ingest = ImageIngest.from_env(self._images, self._thumbs, on_commit=self._move_image)
+        self._backups = BackupSet(os.path.join(app_path, "backups"))
+        self._uploads = {}
+        self._window = None
+        # 同時最多兩個背景工作，其餘排隊；介面與一般查詢不受影響
+        self._jobs = JobRunner(max_workers=2, notify=self._push_job)
+        self._writer = WriteBehind()
+        self._methods_json = None
+        self._upload_dir = os.path.join(self.img_folder, ".uploads")
+        os.makedirs(self._upload_dir, exist_ok=True)
+        # 上次沒完成的上傳直接丟棄
+        for leftover in os.listdir(self._upload_dir):
+            os.remove(os.path.join(self._upload_dir, leftover))
+        self._lock = threading.RLock()
+        self._stats = TradeStats()
+        self._columns = TradeColumns()
+        self._pivot = PivotCube()
+        self._calendar = CalendarIndex()
+        # 所有隨交易增刪而增量維護的索引/統計，都要有 reset()、add(trade) 與 remove(trade)；
+        # 需要保持位置的可另外實作 update(old, new)
+        self._views = [self._stats, self._columns, self._pivot, self._calendar]
+        self._risk_cache = (None, None)
+        self._mc_runs = {}
+        # 統計/欄式/樞紐在背景重建，視窗不必等全表掃完；讀取端都經過 self._lock，
+        # 先確認背景執行緒已拿到鎖再返回，之後的呼叫自然排在重建之後
+        started = threading.Event()
+        threading.Thread(target=self._warm_views, args=(started,), daemon=True).start()
+        started.wait()
+        # 圖片遷移完成後，每次啟動在背景回收過了寬限期的孤兒圖 (只查 images 表)
+        if not self._store.get_meta('images_migrated'):
+            self.migrate_images()
+        else:
+            self.collect_images()
+        self._mark('api_ready')
+
+    def _mark(self, name):
+        self._startup.setdefault(name, time.time())
+
+    def _warm_views(self, started):
+        with self._lock:
+            started.set()
+            self._rebuild_views()
+        self._mark('views_ready')
+
+    def _rebuild_views(self):
+        for view in self._views:
+            view.reset()
+        for trade in self._store.iter_all():
+            for view in self._views:
+                view.add(trade)
+
+    def _on_change(self, old, new):
+        for view in self._views:
+            if old is not None and new is not None and hasattr(view, 'update'):
+                view.update(old, new)
+                continue
+            if old is not None: view.remove(old)
+            if new is not None: view.add(new)
 
     def load_data(self):
-        if os.path.exists(self.data_file):
-            try:
-                with open(self.data_file, 'r', encoding='utf-8') as f:
-                    return f.read()
-            except:
-                return "[]"
-        return "[]"
+        try:
+            return json.dumps(self._store.all(), ensure_ascii=False)
+        except:
+            return "[]"
 
+    # 整份覆寫交給背景寫入：呼叫者在等，立即提交 (同時送來的多份只提交最後一份)；提交失敗時回傳錯誤
     def save_data(self, data_json):
         try:
-            with open(self.data_file, 'w', encoding='utf-8') as f:
-                f.write(data_json)
+            trades = json.loads(data_json)
+            def commit():
+                with self._lock:
+                    self._store.replace_all(trades)
+                    self._rebuild_views()
+            self._writer.submit('trades', commit, urgent=True).result()
             return "ok"
         except Exception as e:
             return str(e)
 
+    # 單筆操作只寫一列，不再整份重寫
+    def add_trade(self, trade_json):
+        try:
+            trade = json.loads(trade_json)
+            if trade.get('id') is None:
+                trade['id'] = int(time.time()*1000)
+            with self._lock:
+                self._store.insert(trade)
+                self._on_change(None, trade)
+            return trade['id']
+        except Exception as e:
+            return f"error: {str(e)}"
+
+    def update_trade(self, trade_json):
+        try:
+            trade = json.loads(trade_json)
+            with self._lock:
+                old = self._store.update(trade)
+                if old is None:
+                    return "not found"
+                self._on_change(old, trade)
+            return "ok"
+        except Exception as e:
+            return f"error: {str(e)}"
+
+    def delete_trade(self, trade_id):
+        try:
+            with self._lock:
+                old = self._store.delete(trade_id)
+                if old is None:
+                    return "not found"
+                self._on_change(old, None)
+            return "ok"
+        except Exception as e:
+            return f"error: {str(e)}"
+
+    def get_summary(self, dollar_per_r=200):
+        with self._lock:
+            return json.dumps(self._stats.summary(float(dollar_per_r or 200)), ensure_ascii=False)
+
+    # 圖表資料全部在後端以向量運算產生，前端只拿結果陣列
+    # max_points 給畫布寬度時，資金曲線以 LTTB 降到該點數，equityX 為對應的交易序號
+    def get_chart_data(self, dollar_per_r=200, max_points=0):
+        dollar_per_r = float(dollar_per_r or 200)
+        with self._lock:
+            labels, values = self._columns.pnl_by('context', dollar_per_r)
+            equity = self._columns.equity(dollar_per_r)
+            x = np.arange(1, len(equity) + 1)
+            if max_points and len(equity) > int(max_points):
+                keep = lttb_indices(x, equity, int(max_points))
+                x, equity = x[keep], equity[keep]
+            return json.dumps({
+                "equityX": x.tolist(),
+                "equity": round_list(equity),
+                "hourly": round_list(self._columns.hourly_pnl(dollar_per_r)),
+                "context": {"labels": labels, "values": round_list(values)},
+            }, ensure_ascii=False)
+
+    # 風險指標在下一次交易異動前都從快取回傳，儀表板可以頻繁輪詢
+    def get_risk_metrics(self, window=20, dollar_per_r=200):
+        window = max(0, int(window or 0))
+        dollar_per_r = float(dollar_per_r or 200)
+        with self._lock:
+            key = (self._columns.version, self._columns.size, window)
+            if self._risk_cache[0] != key:
+                self._risk_cache = (key, risk_metrics(self._columns.r_series(), window))
+            metrics = dict(self._risk_cache[1])
+        if metrics.get("maxDrawdownR") is not None:
+            metrics["maxDrawdown"] = round(metrics["maxDrawdownR"] * dollar_per_r, 2)
+        return json.dumps(metrics, ensure_ascii=False)
+
+    # 蒙地卡羅：背景執行並立即回傳 run id；horizon 預設為目前筆數
+    def run_monte_carlo(self, n_paths=10000, horizon=0, filters_json="{}", mode="bootstrap"):
+        try:
+            with self._lock:
+                r = self._columns.select(json.loads(filters_json or "{}")).copy()
+            if len(r) == 0:
+                return "error: no trades"
+            n_paths = max(1, int(n_paths))
+            horizon = len(r) if mode == "shuffle" else max(1, int(horizon or len(r)))
+            run = MonteCarloRun(secrets.token_hex(6), r, n_paths, horizon, mode)
+            # 只保留最近幾次的結果
+            for old_id in list(self._mc_runs)[:-4]:
+                if self._mc_runs[old_id].status != "running":
+                    del self._mc_runs[old_id]
+            self._mc_runs[run.id] = run
+            self._jobs.submit("monte_carlo", lambda job: self._run_monte_carlo(job, run), job_id=run.id)
+            return run.id
+        except Exception as e:
+            return f"error: {str(e)}"
+
+    def _run_monte_carlo(self, job, run):
+        # 取消由工作的 Event 傳進模擬迴圈
+        run.cancelled = job.cancelled
+        run.run(on_progress=lambda done, total: job.report(done, total))
+        if run.status == "cancelled":
+            raise JobCancelled()
+        if run.status == "failed":
+            raise RuntimeError(run.error)
+        return {"paths": run.done_paths, "elapsed": round(run.elapsed, 2)}
+
+    def get_monte_carlo(self, run_id, dollar_per_r=200):
+        run = self._mc_runs.get(run_id)
+        if run is None:
+            return json.dumps({"status": "unknown"})
+        return json.dumps(run.snapshot(float(dollar_per_r or 200)))
+
+    def cancel_monte_carlo(self, run_id):
+        return "ok" if self._jobs.cancel(run_id) else "not found"
+
+    # dims_json 例如 ["context", "method"]；可選 context、method、emotion、trade_type、hour、weekday
+    def get_pivot(self, dims_json='["context", "method"]'):
+        try:
+            dims = json.loads(dims_json)
+            with self._lock:
+                cells = self._pivot.pivot(dims)
+            values = [sorted({c["key"][i] for c in cells}, key=lambda v: (v is None, str(v) if not isinstance(v, int) else f"{v:04d}"))
+                      for i in range(len(dims))]
+            return json.dumps({"dims": dims, "values": values, "cells": cells}, ensure_ascii=False)
+        except Exception as e:
+            return json.dumps({"error": str(e)})
+
+    # 日曆損益：granularity 為 day / week / month，start / end 為日期 (含)，空值表示不限
+    def get_calendar(self, start="", end="", granularity="day", dollar_per_r=200):
+        try:
+            dollar_per_r = float(dollar_per_r or 200)
+            with self._lock:
+                buckets = self._calendar.buckets(start, end, granularity)
+                undated = self._calendar.undated
+            rows = []
+            total = [0, 0, 0, 0.0, 0.0, 0.0]
+            for key, (count, wins, losses, sum_r, gross_win, gross_loss) in buckets.items():
+                rows.append({"key": key, "count": count, "wins": wins, "losses": losses,
+                             "winRate": wins / count if count else 0.0, "sumR": round(sum_r, 4),
+                             "pnl": round(sum_r * dollar_per_r, 2),
+                             "pf": round(gross_win / gross_loss, 4) if gross_loss > 0 else None})
+                for k, v in enumerate((count, wins, losses, sum_r, gross_win, gross_loss)):
+                    total[k] += v
+            return json.dumps({"granularity": granularity, "start": start, "end": end, "buckets": rows,
+                               "total": {"count": total[0], "wins": total[1], "losses": total[2],
+                                         "sumR": round(total[3], 4), "pnl": round(total[3] * dollar_per_r, 2)},
+                               "undated": undated})
+        except Exception as e:
+            return json.dumps({"error": str(e)})
+
+    def get_trade(self, trade_id):
+        trade = self._store.get(trade_id)
+        return json.dumps(trade, ensure_ascii=False) if trade else ""
+
+    # 表格分頁：只回傳可見範圍的列；sort 為欄位名，前綴 '-' 表示遞減
+    def query_trades(self, offset=0, limit=50, filters_json="{}", sort="-seq"):
+        try:
+            offset = max(0, int(offset))
+            limit = max(1, min(int(limit), 500))
+            total, rows = self._store.query(offset, limit, json.loads(filters_json or "{}"), sort or "-seq")
+            return json.dumps({"total": total, "offset": offset, "rows": rows}, ensure_ascii=False)
+        except Exception as e:
+            return json.dumps({"error": str(e)})
+
+    # 全文檢索備註、策略、背景等欄位 (中英混合)，依相關度排序
+    def search(self, query, limit=50):
+        try:
+            t0 = time.perf_counter()
+            total, rows = self._store.search(query, max(1, min(int(limit), 500)))
+            return json.dumps({"total": total, "rows": rows, "ms": round((time.perf_counter() - t0) * 1000, 2)},
+                              ensure_ascii=False)
+        except Exception as e:
+            return json.dumps({"error": str(e)})
+
+    # filters_json 例如 {"method": "雙底", "result": ["獲利", "打平"]}，"q" 為全文檢索
+    def count_trades(self, filters_json="{}"):
+        try:
+            return self._store.count(json.loads(filters_json or "{}"))
+        except Exception as e:
+            return f"error: {str(e)}"
+
     def load_methods(self):
         default = ["三推底", "三推頂", "雙底", "雙頂", "突破有跟隨", "突破無跟隨", "TR", "重大趨勢反轉"]
+        if self._methods_json is not None:
+            # 尚未寫出的最新設定
+            return self._methods_json
         if os.path.exists(self.config_file):
             try:
                 with open(self.config_file, 'r', encoding='utf-8') as f:
@@ -45,10 +2406,49 @@ class Api:
         return json.dumps(default)
 
     def save_methods(self, json_str):
-        with open(self.config_file, 'w', encoding='utf-8') as f:
-            f.write(json_str)
+        try:
+            json.loads(json_str)
+        except ValueError as e:
+            return str(e)
+        self._methods_json = json_str
+        self._writer.submit('methods', lambda: atomic_write(self.config_file, json_str))
         return "ok"
 
+    # 關閉視窗時把背景寫入全部寫出
+    def flush(self):
+        self._metrics.dump()
+        return "ok" if self._writer.flush() else "timeout"
+
+    # 收尾：還在跑的背景工作直接取消 (匯入會撤回、匯出會刪掉半成品)，寫出待寫資料，
+    # 再停掉各執行緒池與媒體伺服器
+    def _shutdown(self):
+        self._window = None
+        self._jobs.shutdown()
+        self._ingest.shutdown()
+        self.flush()
+        self._writer.close()
+        self._thumbs.pool.shutdown(wait=True, cancel_futures=True)
+        self._media.stop()
+
+    def get_metrics(self, reset=False):
+        snapshot = self._metrics.snapshot()
+        if reset:
+            self._metrics.reset()
+        return json.dumps(snapshot)
+
+    # 前端 performance.now() 標記：[{name, start, duration}]，start 相對 timeOrigin (ms)
+    # 名稱加上 "js:" 前綴，與後端呼叫放在同一份統計，兩者相減即是橋接與 JSON 的開銷
+    def report_marks(self, marks_json):
+        try:
+            payload = json.loads(marks_json)
+            origin = payload["timeOrigin"] / 1000
+            for mark in payload["marks"]:
+                self._metrics.record("js:" + mark["name"], origin + mark["start"] / 1000, mark["duration"], tid=0)
+            return len(payload["marks"])
+        except Exception as e:
+            return f"error: {e}"
+
+    # 原始內容落地後立即回傳檔名；重新編碼與縮圖交給入庫執行緒池
     def save_image(self, base64_str):
         try:
             if "," in base64_str:
@@ -57,578 +2457,488 @@ class Api:
                 encoded = base64_str
             
             data = base64.b64decode(encoded)
-            filename = f"img_{int(time.time()*1000)}.jpg"
-            filepath = os.path.join(self.img_folder, filename)
-            
-            with open(filepath, "wb") as f:
-                f.write(data)
+            filename = self._images.put(data)
+            self._ingest.schedule(filename)
+            return filename
+        except Exception as e:
+            return f"error: {str(e)}"
+
+    # 批次匯入在背景執行，立即回傳匯入批號；進度用 get_import_progress 查詢
+    def import_trades(self, path, mapping_json="{}"):
+        try:
+            importer = TradeImporter(path, json.loads(mapping_json or "{}"))
+        except Exception as e:
+            return f"error: {str(e)}"
+        job = self._jobs.submit("import", lambda job: self._run_import(job, importer), job_id=importer.import_id)
+        job.report(0, importer.total_bytes, path=path, inserted=0, skipped=0)
+        return importer.import_id
+
+    # 進度以讀取的位元組計；取消或中途失敗就整批撤回，不留下半套資料
+    def _run_import(self, job, importer):
+        inserted_total = skipped = 0
+        try:
+            for batch in importer.batches():
+                job.check()
+                with self._lock:
+                    inserted = self._store.insert_many(batch, importer.import_id)
+                    for trade in inserted:
+                        self._on_change(None, trade)
+                inserted_total += len(inserted)
+                skipped += len(batch) - len(inserted)
+                job.report(importer.bytes_read, inserted=inserted_total, skipped=skipped)
+        except BaseException:
+            self.rollback_import(importer.import_id)
+            raise
+        return {"inserted": inserted_total, "skipped": skipped}
+
+    # 相容舊介面：匯入工作的進度攤平成一層
+    def get_import_progress(self, import_id):
+        job = self._jobs.get(import_id)
+        if job is None:
+            return json.dumps({"status": "unknown"})
+        status = "rolled back" if job.info.get("rolledBack") else job.status
+        return json.dumps(dict(job.info, id=job.id, status=status, bytes=job.done, totalBytes=job.total,
+                               error=job.error), ensure_ascii=False)
+
+    def rollback_import(self, import_id):
+        with self._lock:
+            removed = self._store.delete_import(import_id)
+            for trade in removed:
+                self._on_change(trade, None)
+        job = self._jobs.get(import_id)
+        if job is not None:
+            job.info["rolledBack"] = True
+            job.push()
+        return len(removed)
+
+    def choose_import_file(self):
+        paths = webview.windows[0].create_file_dialog(file_types=('交易資料 (*.csv;*.json;*.jsonl)', 'All files (*.*)'))
+        return paths[0] if paths else ""
+
+    # 分段上傳：begin → append_chunk (可多次) → finish，回傳與 save_image 相同的檔名
+    def begin_image_upload(self):
+        upload_id = secrets.token_hex(8)
+        with self._lock:
+            self._uploads[upload_id] = ImageUpload(os.path.join(self._upload_dir, upload_id + ".part"))
+        return upload_id
+
+    def append_chunk(self, upload_id, chunk_b64):
+        try:
+            upload = self._uploads[upload_id]
+            if "," in chunk_b64 and upload.size == 0 and not upload.pending:
+                # 允許第一段直接帶 data URL 標頭
+                chunk_b64 = chunk_b64.split(",", 1)[1]
+            upload.append(chunk_b64)
+            return upload.size
+        except KeyError:
+            return "error: unknown upload"
+        except Exception as e:
+            self.abort_image_upload(upload_id)
+            return f"error: {str(e)}"
+
+    def finish_image_upload(self, upload_id):
+        with self._lock:
+            upload = self._uploads.pop(upload_id, None)
+        if upload is None:
+            return "error: unknown upload"
+        try:
+            filename = self._images.commit_file(upload.path, upload.finish())
+            self._ingest.schedule(filename)
             return filename
         except Exception as e:
+            upload.abort()
             return f"error: {str(e)}"
 
-    # 新增：直接讀取圖片並轉回 Base64 給前端顯示 (解決路徑問題)
+    def abort_image_upload(self, upload_id):
+        with self._lock:
+            upload = self._uploads.pop(upload_id, None)
+        if upload is not None:
+            upload.abort()
+        return "ok"
+
+    # 一次性遷移：舊的 img_{ms}.jpg 依內容雜湊搬進分片資料夾，並改寫交易的 img 欄位
+    def migrate_images(self):
+        return self._jobs.submit("migrate_images", self._migrate_images).id
+
+    def _migrate_images(self, job):
+        moved = 0
+        refs = self._store.legacy_image_refs()
+        for i, (legacy, trade_ids) in enumerate(refs.items()):
+            job.check()
+            job.report(i, len(refs))
+            path = os.path.join(self.img_folder, legacy)
+            if not os.path.isfile(path):
+                continue
+            name = self._images.adopt(path)
+            old_thumb = os.path.join(self.img_folder, self._thumbs.thumb_name(legacy))
+            if os.path.exists(old_thumb):
+                os.remove(old_thumb)
+            with self._lock:
+                for trade_id in trade_ids:
+                    trade = self._store.get(trade_id)
+                    if trade is None or trade.get('img') != legacy:
+                        continue
+                    new = dict(trade, img=name)
+                    self._store.update(new)
+                    self._on_change(trade, new)
+            self._store.forget_image(legacy)
+            moved += 1
+        self._store.set_meta('images_migrated', datetime.now().isoformat())
+        return moved
+
+    # 備份：背景產生增量快照並回傳工作 id；只讀上一份之後的變更紀錄與新圖片，
+    # 耗時隨變動量而非日誌大小成長。第一份 (或上一份的檔案不見了) 是完整快照
+    def create_backup(self):
+        return self._jobs.submit("backup", self._create_backup).id
+
+    def _create_backup(self, job):
+        last = json.loads(self._store.get_meta('backup_last') or 'null')
+        files = self._backups.files()
+        full = last is None or last["id"] not in files
+        snapshot_id = max(list(files) + [last["id"] if last else 0]) + 1
+        path = self._backups.path_for(snapshot_id)
+        tmp = path + ".tmp"
+        snap = self._store.read_snapshot()
+        manifest = {"version": 1, "id": snapshot_id, "parent": None if full else last["id"], "full": full,
+                    "created": datetime.now().isoformat(timespec='seconds'),
+                    "log": [0 if full else last["log"], snap.log_end], "total": snap.total,
+                    "trades": 0, "deletes": 0, "images": {}, "blobs": [], "missing": 0}
+        recorded = []
+        stored = set()
+        try:
+            with zipfile.ZipFile(tmp, 'w', zipfile.ZIP_DEFLATED) as zf:
+                with zf.open("trades.jsonl", 'w', force_zip64=True) as f:
+                    for i, (op, key, data) in enumerate(snap.changes(None if full else last["log"])):
+                        if i % 1000 == 0:
+                            job.check()
+                            job.report(message=f"交易 {i}")
+                        if op == "put":
+                            f.write(f'["put", {key}, {data}]\n'.encode('utf-8'))
+                            manifest["trades"] += 1
+                        else:
+                            f.write((json.dumps(["del", key], ensure_ascii=False) + "\n").encode('utf-8'))
+                            manifest["deletes"] += 1
+                images = snap.images(full)
+                for i, (name, size) in enumerate(images):
+                    job.check()
+                    job.report(i, len(images), message="圖片")
+                    src = self._images.path_of(name)
+                    if not os.path.isfile(src):
+                        manifest["missing"] += 1
+                        continue
+                    digest = file_sha256(src)
+                    manifest["images"][name] = digest
+                    recorded.append((name, size, digest))
+                    # 同樣內容在之前的快照 (或這份稍早) 已經有了就只記對應
+                    if digest in stored or (not full and self._store.backed_up(digest)):
+                        continue
+                    zf.write(src, "images/" + digest, compress_type=zipfile.ZIP_STORED)
+                    stored.add(digest)
+                    manifest["blobs"].append(digest)
+                zf.writestr("config.json", self.load_methods())
+                zf.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False))
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        finally:
+            snap.close()
+        self._store.commit_backup(snap.log_end, recorded, json.dumps({"id": snapshot_id, "log": snap.log_end}), full)
+        kind = "完整" if full else "增量"
+        return (f"已備份至: {path}\n{kind}快照 #{snapshot_id}：{manifest['trades']} 筆變動、"
+                f"{manifest['deletes']} 筆刪除、{len(manifest['blobs'])} 張新圖片")
+
+    def list_backups(self):
+        try:
+            return json.dumps([{k: v for k, v in m.items() if k not in ("images", "blobs")}
+                               for m in self._backups.list()], ensure_ascii=False)
+        except Exception as e:
+            return json.dumps({"error": str(e)})
+
+    # 還原到任一快照：交易整份取代 (保留原本的先後順序)，缺少的圖片從快照寫回，策略清單一併還原
+    def restore_backup(self, snapshot_id):
+        try:
+            chain = self._backups.chain(int(snapshot_id))
+        except Exception as e:
+            return f"error: {e}"
+        return self._jobs.submit("restore", lambda job: self._restore_backup(job, chain)).id
+
+    def _restore_backup(self, job, chain):
+        trades = {}
+        images = {}
+        blobs = {}
+        config = None
+        for i, (path, manifest) in enumerate(chain):
+            job.check()
+            job.report(i, len(chain), message=f"快照 #{manifest['id']}")
+            with zipfile.ZipFile(path) as zf:
+                with zf.open("trades.jsonl") as f:
+                    for line in f:
+                        op = json.loads(line)
+                        if op[0] == "put":
+                            trades[op[2]['id']] = (op[1], op[2])
+                        else:
+                            trades.pop(op[1], None)
+                config = zf.read("config.json").decode('utf-8')
+            images.update(manifest["images"])
+            blobs.update((digest, path) for digest in manifest["blobs"])
+        rows = [trade for _, trade in sorted(trades.values(), key=lambda v: v[0])]
+
+        # 只寫回目前資料夾裡沒有的圖，依所在的快照檔分組，每個檔只開一次
+        wanted = OrderedDict()
+        missing = restored = 0
+        for name in sorted({t.get('img') for t in rows if t.get('img')}):
+            if os.path.isfile(self._images.path_of(name)):
+                continue
+            digest = images.get(name)
+            if digest not in blobs:
+                missing += 1
+                continue
+            wanted.setdefault(blobs[digest], []).append((name, digest))
+        for path, entries in wanted.items():
+            with zipfile.ZipFile(path) as zf:
+                for name, digest in entries:
+                    job.check()
+                    with zf.open("images/" + digest) as f:
+                        self._images.restore(name, f)
+                    self._thumbs.discard(name)
+                    restored += 1
+
+        job.check()
+        with self._lock:
+            self._store.replace_all(rows)
+            self._rebuild_views()
+        if config is not None:
+            self.save_methods(config)
+        note = f"，缺少 {missing} 張" if missing else ""
+        return f"已還原至快照 #{chain[-1][1]['id']}：{len(rows)} 筆交易，寫回 {restored} 張圖片{note}"
+
+    # 圖片垃圾回收：引用數歸零超過 grace_hours 的圖移到 images_archive/ (archive=False 直接刪除)
+    def collect_images(self, archive=True, grace_hours=None):
+        grace = ImageStore.ORPHAN_GRACE if grace_hours in (None, "") else float(grace_hours) * 3600
+        return self._jobs.submit("collect_images", lambda job: self._collect_images(job, bool(archive), grace)).id
+
+    def _collect_images(self, job, archive, grace):
+        if not self._store.get_meta('images_tracked'):
+            job.report(message="盤點圖片資料夾")
+            self._store.track_images(list(self._images.walk()))
+            self._store.set_meta('images_tracked', datetime.now().isoformat())
+        # 舊資料只有檔名沒有大小的，逐批補上；檔案不見了記 0
+        while True:
+            names = self._store.unsized_images()
+            if not names:
+                break
+            job.check()
+            self._store.track_images([(n, os.path.getsize(p) if os.path.isfile(p) else 0)
+                                      for n, p in ((n, self._images.path_of(n)) for n in names)])
+        collected = freed = 0
+        before = time.time() - grace
+        while True:
+            batch = self._store.orphaned_images(before)
+            job.report(collected, collected + len(batch), bytes=freed)
+            if not batch:
+                break
+            for name, size in batch:
+                job.check()
+                freed += self._images.collect(name, archive)
+                self._thumbs.discard(name)
+                collected += 1
+        totals = json.loads(self._store.get_meta('images_collected', '{}'))
+        totals["images"] = totals.get("images", 0) + collected
+        key = "archivedBytes" if archive else "deletedBytes"
+        totals[key] = totals.get(key, 0) + freed
+        totals["last"] = datetime.now().isoformat(timespec='seconds')
+        self._store.set_meta('images_collected', json.dumps(totals))
+        return {"images": collected, "bytes": freed, "archived": archive}
+
+    # 磁碟用量報告：總量、引用中/孤兒、依月份與策略分組，以及歷次回收的累計
+    def get_storage_report(self):
+        try:
+            report = self._store.storage_report()
+            report["collected"] = json.loads(self._store.get_meta('images_collected', '{}'))
+            report["graceHours"] = ImageStore.ORPHAN_GRACE / 3600
+            report["ingest"] = self._ingest.snapshot()
+            return json.dumps(report, ensure_ascii=False)
+        except Exception as e:
+            return json.dumps({"error": str(e)})
+
+    # 入庫重新編碼後換了檔名：引用舊檔名的交易改指新檔，索引/統計照一般修改處理
+    def _move_image(self, old, new):
+        with self._lock:
+            for before, after in self._store.move_image(old, new):
+                self._on_change(before, after)
+
+    # 圖片改由本機伺服器以 URL 提供；前端取一次 base 後自行組 URL
+    def get_media_base(self):
+        return self._media.base_url()
+
+    def get_app_url(self):
+        return f"{self._media.base_url()}/assets/index.html"
+
+    # 冷啟動報告：行程啟動 → API 就緒 → 視窗顯示 → 首次繪製 → 資料渲染完成 (毫秒，相對行程啟動)
+    # 前端傳來的是 performance.timeOrigin (epoch ms) 與相對它的 performance.now() 時間點
+    def report_startup(self, marks_json):
+        try:
+            marks = json.loads(marks_json)
+            origin = marks["timeOrigin"] / 1000
+            def since_start(t):
+                return None if t is None else round((t - STARTED_AT) * 1000)
+            def page(key):
+                return None if marks.get(key) is None else since_start(origin + marks[key] / 1000)
+            report = {
+                "at": datetime.now().isoformat(timespec='seconds'),
+                "apiReady": since_start(self._startup.get('api_ready')),
+                "viewsReady": since_start(self._startup.get('views_ready')),
+                "shown": since_start(self._startup.get('shown')),
+                "domReady": page("domReady"),
+                "firstPaint": page("firstPaint"),
+                "dataRendered": page("dataRendered"),
+                "trades": self._store.count(),
+            }
+            with open(self.startup_log, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(report) + "\n")
+            return json.dumps(report)
+        except Exception as e:
+            return f"error: {e}"
+
+    def get_image_url(self, filename):
+        if not filename or not os.path.isfile(os.path.join(self.img_folder, filename)):
+            return ""
+        return f"{self._media.base_url()}/images/{quote(filename)}"
+
+    # 舊介面：直接讀取圖片並轉回 Base64 (保留相容)
     def get_image_base64(self, filename):
         try:
             filepath = os.path.join(self.img_folder, filename)
             if not os.path.exists(filepath):
                 return ""
             with open(filepath, "rb") as f:
-                encoded = base64.b64encode(f.read()).decode('utf-8')
-                return f"data:image/jpeg;base64,{encoded}"
+                data = f.read()
+            mime = sniff_image_type(data[:16]) or "image/jpeg"
+            return f"data:{mime};base64,{base64.b64encode(data).decode('utf-8')}"
         except:
             return ""
 
-    def export_csv(self, json_str):
-        try:
+    # 匯出資料來源：舊介面傳入 JSON 字串時用它，否則直接從資料庫串流
+    def _export_source(self, json_str=None):
+        if json_str:
             data = json.loads(json_str)
-            if not data: return "no data"
-            
-            csv_file = os.path.join(self.app_path, f"export_{int(time.time())}.csv")
-            
-            # 扁平化處理以便 CSV 寫入
-            flat_data = []
-            for item in data:
-                flat_item = item.copy()
-                # 移除圖片欄位避免 CSV 太大或亂碼，只留檔名
-                if 'img' not in flat_item: flat_item['img'] = ""
-                flat_data.append(flat_item)
-
-            if not flat_data: return "empty"
-            keys = flat_data[0].keys()
-            
-            with open(csv_file, 'w', newline='', encoding='utf-8-sig') as f:
-                writer = csv.DictWriter(f, fieldnames=keys)
-                writer.writeheader()
-                writer.writerows(flat_data)
-            
-            return f"已匯出至: {csv_file}"
-        except Exception as e:
-            return str(e)
+            return lambda: iter(data)
+        return self._store.iter_all
 
-# 前端介面
-HTML_CODE = r"""
-<!DOCTYPE html>
-<html lang="zh-TW">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Trading Journal V6.1</title>
-    <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-    <style>
-        :root { --primary: #2c3e50; --bg: #f8f9fa; --card-bg: #fff; --border: #e9ecef; --text: #495057; --win: #27ae60; --loss: #c0392b; }
-        * { margin: 0; padding: 0; box-sizing: border-box; }
-        body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, sans-serif; background: var(--bg); color: var(--text); padding: 30px; }
-        .container { max-width: 1400px; margin: 0 auto; }
-
-        header { display: flex; justify-content: space-between; align-items: center; margin-bottom: 20px; padding-bottom: 20px; border-bottom: 1px solid var(--border); }
-        h1 { font-weight: 300; letter-spacing: 1px; color: var(--primary); font-size: 26px; }
-        .btn-group { display: flex; gap: 10px; }
-        button { cursor: pointer; border: none; border-radius: 4px; padding: 8px 16px; font-size: 13px; transition: 0.2s; }
-        .btn-save { background: var(--primary); color: white; }
-        .btn-clear { background: #fff; border: 1px solid #ffcdd2; color: #e57373; }
-        .btn-export { background: #2ecc71; color: white; }
-
-        .settings-bar { background: #e3f2fd; padding: 10px 20px; border-radius: 6px; margin-bottom: 20px; display: flex; align-items: center; gap: 10px; color: #1565c0; font-size: 13px; }
-        .settings-bar input { width: 80px; padding: 5px; border: 1px solid #90caf9; border-radius: 4px; color: #1565c0; font-weight: bold; text-align: center; }
-
-        .stats-bar { display: grid; grid-template-columns: repeat(4, 1fr); gap: 20px; margin-bottom: 30px; }
-        .stat-card { background: var(--card-bg); padding: 20px; border-radius: 8px; box-shadow: 0 2px 8px rgba(0,0,0,0.03); text-align: center; }
-        .stat-val { font-size: 28px; font-weight: 600; color: var(--primary); margin-bottom: 5px; }
-
-        .main-grid { display: grid; grid-template-columns: 320px 1fr; gap: 25px; align-items: start; }
-        
-        /* 修正：移除 sticky，讓輸入區自然流動，解決滑動問題 */
-        .input-section { background: var(--card-bg); padding: 25px; border-radius: 8px; box-shadow: 0 2px 8px rgba(0,0,0,0.03); }
-        
-        .form-group { margin-bottom: 15px; }
-        .form-group label { display: block; font-size: 12px; color: #999; margin-bottom: 6px; font-weight: 600; }
-        input, select { width: 100%; padding: 10px; border: 1px solid var(--border); border-radius: 4px; font-size: 13px; background: #fff; outline: none; }
-        
-        .img-drop-zone { border: 2px dashed #ddd; padding: 20px; text-align: center; color: #999; font-size: 12px; border-radius: 4px; cursor: pointer; transition: 0.2s; }
-        .img-drop-zone:hover { border-color: var(--primary); color: var(--primary); background: #f8f9fa; }
-        .img-preview { max-width: 100%; margin-top: 10px; border-radius: 4px; display: none; }
-
-        .btn-add { width: 100%; background: var(--primary); color: white; padding: 12px; font-weight: 600; margin-top: 10px; font-size: 14px; }
-        .btn-add:hover { background: #34495e; }
-
-        .charts-row { display: grid; grid-template-columns: 1.5fr 1fr 1fr; gap: 20px; margin-bottom: 30px; }
-        .chart-box { background: var(--card-bg); padding: 20px; border-radius: 8px; box-shadow: 0 2px 8px rgba(0,0,0,0.03); height: 350px; position: relative; display: flex; flex-direction: column; }
-        .chart-container { flex: 1; position: relative; min-height: 0; }
-
-        .heatmap-container { overflow-x: auto; margin-top: 20px; }
-        .heatmap-table { width: 100%; border-collapse: collapse; font-size: 12px; }
-        .heatmap-table th, .heatmap-table td { border: 1px solid #eee; padding: 8px; text-align: center; }
-        .heatmap-table th { background: #f8f9fa; color: #666; }
-        .heatmap-table td { color: #333; }
-
-        .table-box { background: var(--card-bg); border-radius: 8px; overflow: hidden; box-shadow: 0 2px 8px rgba(0,0,0,0.03); }
-        .data-table { width: 100%; border-collapse: collapse; }
-        .data-table th { text-align: left; padding: 12px 20px; border-bottom: 1px solid var(--border); font-size: 11px; color: #999; text-transform: uppercase; }
-        .data-table td { padding: 12px 20px; border-bottom: 1px solid #f9f9f9; font-size: 13px; vertical-align: middle; }
-        
-        .win-text { color: var(--win); font-weight: 600; }
-        .loss-text { color: var(--loss); font-weight: 600; }
-        .tag { padding: 2px 6px; border-radius: 4px; background: #eee; font-size: 11px; color: #666; margin-right: 4px; white-space: nowrap; }
-        
-        .img-icon { cursor: pointer; font-size: 16px; color: #3498db; }
-        .img-popup { position: fixed; top: 50%; left: 50%; transform: translate(-50%, -50%); z-index: 1000; background: white; padding: 10px; border-radius: 8px; box-shadow: 0 5px 20px rgba(0,0,0,0.3); display: none; max-height: 80vh; max-width: 80vw; }
-        .img-popup img { max-width: 100%; max-height: 75vh; border-radius: 4px; }
-        .overlay { position: fixed; top: 0; left: 0; width: 100%; height: 100%; background: rgba(0,0,0,0.5); z-index: 999; display: none; }
-    </style>
-</head>
-<body>
-
-<div class="overlay" onclick="closeImg()"></div>
-<div class="img-popup" id="popup"><img id="popupImg" src=""></div>
-
-<div class="container">
-    <header>
-        <h1>TRADING JOURNAL <span style="font-size:14px; color:#ccc; margin-left:10px;">V6.1 Fixed</span></h1>
-        <div class="btn-group">
-            <button class="btn-export" onclick="exportCSV()">📂 匯出 Excel</button>
-            <button class="btn-save" onclick="saveData()">💾 備份</button>
-            <button class="btn-clear" onclick="clearAllData()">🗑️ 清空</button>
-        </div>
-    </header>
-
-    <div class="settings-bar">
-        <span>💰 設定 1R 金額 (USD): $</span>
-        <input type="number" id="oneRValue" value="200" onchange="renderUI()">
-    </div>
-
-    <div class="stats-bar">
-        <div class="stat-card">
-            <div class="stat-val" id="totalProfit">$0</div>
-            <div class="stat-label">總獲利</div>
-        </div>
-        <div class="stat-card">
-            <div class="stat-val" id="totalR">0R</div>
-            <div class="stat-label">累積 R</div>
-        </div>
-        <div class="stat-card">
-            <div class="stat-val" id="winRate">0%</div>
-            <div class="stat-label">勝率</div>
-        </div>
-        <div class="stat-card">
-            <div class="stat-val" id="pf">0.0</div>
-            <div class="stat-label">PF</div>
-        </div>
-    </div>
-
-    <div class="main-grid">
-        <div class="input-section">
-            <div class="form-group">
-                <label>日期時間 (Time)</label>
-                <input type="datetime-local" id="tradeTime">
-            </div>
-
-            <div class="form-group">
-                <label>截圖 (Ctrl+V 或 點擊上傳)</label>
-                <div class="img-drop-zone" id="dropZone" onclick="document.getElementById('fileInput').click()">
-                    📷 點擊選擇圖片 或 直接貼上
-                </div>
-                <input type="file" id="fileInput" accept="image/*" style="display:none" onchange="handleFile(this.files[0])">
-                <img id="preview" class="img-preview">
-            </div>
-
-            <div class="form-group">
-                <label>市場背景</label>
-                <select id="context">
-                    <option value="強趨勢 (Strong Trend)">強趨勢</option>
-                    <option value="交易區間 (Trading Range)">交易區間</option>
-                    <option value="寬通道 (Broad Channel)">寬通道</option>
-                    <option value="窄通道 (Tight Channel)">窄通道</option>
-                    <option value="突破模式 (Breakout Mode)">突破模式</option>
-                    <option value="高潮 (Climax)">高潮</option>
-                </select>
-            </div>
-            
-            <div class="form-group">
-                <label>策略</label>
-                <select id="method"></select>
-                <div style="margin-top:5px; display:flex; gap:5px;">
-                    <button style="flex:1; background:#eee;" onclick="addMethod()">+ 新增</button>
-                    <button style="flex:1; background:#eee;" onclick="delMethod()">- 刪除</button>
-                </div>
-            </div>
-
-            <div class="form-group"><label>型態</label><select id="type"><option value="Swing">Swing</option><option value="Scalp">Scalp</option></select></div>
-            <div class="form-group"><label>情緒</label><select id="emotion"><option value="平靜">平靜</option><option value="急躁">急躁</option><option value="猶豫">猶豫</option><option value="報復">報復</option></select></div>
-            
-            <div class="form-group">
-                <label>結果</label>
-                <select id="result" onchange="updateR()">
-                    <option value="獲利">✅ 獲利</option>
-                    <option value="虧損">❌ 虧損</option>
-                    <option value="打平">⚪ 打平</option>
-                </select>
-            </div>
-            <div class="form-group"><label>R 值</label><input type="number" id="rValue" step="0.1" value="2.0"></div>
-            <div class="form-group"><label>備註</label><input type="text" id="remark"></div>
-
-            <button class="btn-add" onclick="addTrade()">新增交易</button>
-        </div>
-
-        <div class="content-section">
-            <div class="charts-row">
-                <div class="chart-box">
-                    <div style="font-weight:600; margin-bottom:10px;">資金曲線 ($)</div>
-                    <div class="chart-container"><canvas id="equityChart"></canvas></div>
-                </div>
-                <div class="chart-box">
-                    <div style="font-weight:600; margin-bottom:10px;">時段損益 (Hourly PnL)</div>
-                    <div class="chart-container"><canvas id="hourChart"></canvas></div>
-                </div>
-                <div class="chart-box">
-                    <div style="font-weight:600; margin-bottom:10px;">背景損益 (Context)</div>
-                    <div class="chart-container"><canvas id="contextChart"></canvas></div>
-                </div>
-            </div>
-
-            <div class="chart-box" style="margin-bottom:30px; height:auto; min-height:180px;">
-                <div style="font-weight:600; margin-bottom:10px;">🔥 策略勝率矩陣</div>
-                <div class="heatmap-container" id="heatmapContainer"></div>
-            </div>
-
-            <div class="table-box">
-                <table class="data-table">
-                    <thead>
-                        <tr>
-                            <th>時間</th>
-                            <th>圖</th>
-                            <th>背景/策略</th>
-                            <th>結果</th>
-                            <th>R/$</th>
-                            <th>操作</th>
-                        </tr>
-                    </thead>
-                    <tbody id="tableBody"></tbody>
-                </table>
-            </div>
-        </div>
-    </div>
-</div>
-
-<script>
-    let trades = [];
-    let methods = [];
-    let currentImgBase64 = null;
-    let chartInstances = {};
-
-    window.addEventListener('pywebviewready', () => {
-        loadData();
-        loadMethods();
-        const now = new Date();
-        now.setMinutes(now.getMinutes() - now.getTimezoneOffset());
-        document.getElementById('tradeTime').value = now.toISOString().slice(0,16);
-    });
-
-    document.addEventListener('paste', e => {
-        const items = e.clipboardData.items;
-        for (let i = 0; i < items.length; i++) {
-            if (items[i].type.indexOf('image') !== -1) {
-                const blob = items[i].getAsFile();
-                handleFile(blob);
-            }
-        }
-    });
-
-    function handleFile(file) {
-        if(!file) return;
-        const reader = new FileReader();
-        reader.onload = e => {
-            currentImgBase64 = e.target.result;
-            const img = document.getElementById('preview');
-            img.src = currentImgBase64;
-            img.style.display = 'block';
-        };
-        reader.readAsDataURL(file);
-    }
+    # 第一趟只收集欄位聯集 (依首次出現順序)，不保留資料列
+    @staticmethod
+    def _union_fields(rows):
+        fields = {}
+        for row in rows:
+            fields.update(dict.fromkeys(row))
+        # 圖片欄位只留檔名，沒有圖的交易也要有這欄
+        fields.setdefault('img')
+        return list(fields)
 
-    function loadData() {
-        pywebview.api.load_data().then(res => {
-            trades = JSON.parse(res);
-            trades.forEach(t => {
-                if(!t.time) t.time = new Date().toISOString();
-            });
-            renderUI();
-        });
-    }
+    # 匯出都在背景工作中執行，立即回傳工作 id；完成後工作結果為提示訊息
+    def export_csv(self, json_str=None):
+        return self._jobs.submit("export_csv", lambda job: self._export_csv(job, json_str)).id
 
-    function loadMethods() {
-        pywebview.api.load_methods().then(res => {
-            methods = JSON.parse(res);
-            renderMethodSelect();
-            renderHeatmap();
-        });
-    }
+    # 逐列轉交並回報進度；取消時由呼叫者刪掉寫了一半的檔案
+    @staticmethod
+    def _exporting(job, rows, total):
+        for i, row in enumerate(rows):
+            if i % 1000 == 0:
+                job.check()
+                job.report(i, total)
+            yield row
 
-    function exportCSV() {
-        pywebview.api.export_csv(JSON.stringify(trades)).then(alert);
-    }
+    def _export_csv(self, job, json_str=None):
+        source = self._export_source(json_str)
+        fields = self._union_fields(source())
+        if fields == ['img']: return "no data"
+        total = None if json_str else self._store.count()
 
-    function renderMethodSelect() {
-        const sel = document.getElementById('method');
-        const current = sel.value;
-        sel.innerHTML = '';
-        methods.forEach(m => {
-            const opt = document.createElement('option');
-            opt.value = m;
-            opt.textContent = m;
-            sel.appendChild(opt);
-        });
-        if(methods.includes(current)) sel.value = current;
-    }
+        csv_file = os.path.join(self.app_path, f"export_{int(time.time())}.csv")
+        try:
+            with open(csv_file, 'w', newline='', encoding='utf-8-sig') as f:
+                writer = csv.DictWriter(f, fieldnames=fields, restval="", extrasaction='ignore')
+                writer.writeheader()
+                for row in self._exporting(job, source(), total):
+                    writer.writerow(row)
+        except JobCancelled:
+            os.remove(csv_file)
+            raise
 
-    function addMethod() {
-        const m = prompt("新策略名稱:");
-        if (m && !methods.includes(m)) {
-            methods.push(m);
-            pywebview.api.save_methods(JSON.stringify(methods));
-            renderMethodSelect();
-            renderHeatmap();
-        }
-    }
-    
-    function delMethod() {
-        const m = document.getElementById('method').value;
-        if(confirm(`刪除 ${m}?`)) {
-            methods = methods.filter(i => i!==m);
-            pywebview.api.save_methods(JSON.stringify(methods));
-            renderMethodSelect();
-            renderHeatmap();
-        }
-    }
+        return f"已匯出至: {csv_file}"
 
-    function updateR() {
-        const res = document.getElementById('result').value;
-        const rInput = document.getElementById('rValue');
-        if (res === '虧損') rInput.value = -1.0;
-        else if (res === '打平') rInput.value = 0.0;
-        else if (parseFloat(rInput.value) <= 0) rInput.value = 2.0;
-    }
+    # 欄式匯出：fmt 為 "parquet" 或 "arrow" (Arrow IPC)；分批寫入，記憶體只有一批的量
+    def export_columnar(self, fmt="parquet", batch_size=10000):
+        if pa is None:
+            return "error: 需要安裝 pyarrow 才能匯出 Parquet / Arrow"
+        if fmt not in ("parquet", "arrow"):
+            return f"error: unknown format: {fmt}"
+        return self._jobs.submit("export_" + fmt, lambda job: self._export_columnar(job, fmt, batch_size)).id
 
-    function addTrade() {
-        const res = document.getElementById('result').value;
-        let r = parseFloat(document.getElementById('rValue').value);
-        if (res === '虧損' && r > 0) r = -r;
-        if (res === '虧損' && r === 0) r = -1.0;
-        if (res === '打平') r = 0.0;
-
-        // 儲存邏輯
-        const processTrade = (savedImgName) => {
-            const trade = {
-                id: Date.now(),
-                time: document.getElementById('tradeTime').value,
-                img: savedImgName || "",
-                context: document.getElementById('context').value,
-                method: document.getElementById('method').value,
-                trade_type: document.getElementById('type').value,
-                emotion: document.getElementById('emotion').value,
-                result: res,
-                rValue: r,
-                remark: document.getElementById('remark').value
-            };
-            trades.push(trade);
-            pywebview.api.save_data(JSON.stringify(trades));
-            
-            renderUI();
-            currentImgBase64 = null;
-            document.getElementById('preview').style.display = 'none';
-            document.getElementById('preview').src = "";
-            document.getElementById('remark').value = "";
-        };
-
-        if(currentImgBase64) {
-            pywebview.api.save_image(currentImgBase64).then(savedName => {
-                processTrade(savedName);
-            });
-        } else {
-            processTrade("");
-        }
-    }
+    def _export_columnar(self, job, fmt, batch_size):
+        source = self._export_source()
+        fields = self._union_fields(source())
+        if fields == ['img']: return "no data"
 
-    function delTrade(id) {
-        if(confirm('刪除?')) {
-            trades = trades.filter(t => t.id !== id);
-            pywebview.api.save_data(JSON.stringify(trades));
-            renderUI();
-        }
-    }
-    
-    function clearAllData() {
-        if(confirm('清空?')) { trades=[]; pywebview.api.save_data(JSON.stringify(trades)); renderUI(); }
-    }
+        # rValue 為數值，其他欄位一律轉字串 (id 可能是數字也可能是字串)
+        schema = pa.schema([(k, pa.float64() if k == 'rValue' else pa.string()) for k in fields])
+        def to_batch(rows):
+            cols = []
+            for k in fields:
+                if k == 'rValue':
+                    cols.append([r_of(r) for r in rows])
+                else:
+                    cols.append([None if r.get(k) is None else str(r.get(k)) for r in rows])
+            return pa.record_batch(cols, schema=schema)
 
-    // 修正後的圖片顯示：請求後端讀取 Base64
-    function showImg(filename) {
-        if(!filename) return;
-        pywebview.api.get_image_base64(filename).then(base64Data => {
-            if(base64Data) {
-                document.getElementById('popupImg').src = base64Data;
-                document.querySelector('.overlay').style.display = 'block';
-                document.getElementById('popup').style.display = 'block';
-            } else {
-                alert("圖片讀取失敗 (可能已刪除)");
-            }
-        });
-    }
-    
-    function closeImg() {
-        document.querySelector('.overlay').style.display = 'none';
-        document.getElementById('popup').style.display = 'none';
-        document.getElementById('popupImg').src = "";
-    }
+        out_file = os.path.join(self.app_path, f"export_{int(time.time())}.{'parquet' if fmt == 'parquet' else 'arrow'}")
+        writer = pq.ParquetWriter(out_file, schema) if fmt == 'parquet' else pa.ipc.new_file(out_file, schema)
+        try:
+            with writer:
+                rows = []
+                for row in self._exporting(job, source(), self._store.count()):
+                    rows.append(row)
+                    if len(rows) >= batch_size:
+                        writer.write_batch(to_batch(rows))
+                        rows = []
+                if rows:
+                    writer.write_batch(to_batch(rows))
+        except JobCancelled:
+            os.remove(out_file)
+            raise
+        return f"已匯出至: {out_file}"
 
-    function renderUI() {
-        const dollarPerR = parseFloat(document.getElementById('oneRValue').value) || 200;
-
-        const total = trades.length;
-        const totalR = trades.reduce((s, t) => s + t.rValue, 0);
-        const totalPnL = totalR * dollarPerR;
-        const wins = trades.filter(t => t.result === '獲利').length;
-        const winRate = total > 0 ? (wins / total * 100).toFixed(0) + '%' : '0%';
-        const grossWin = trades.filter(t => t.rValue > 0).reduce((s,t) => s+t.rValue, 0);
-        const grossLoss = Math.abs(trades.filter(t => t.rValue < 0).reduce((s,t) => s+t.rValue, 0));
-        const pf = grossLoss > 0 ? (grossWin / grossLoss).toFixed(2) : (grossWin > 0 ? '∞' : '0.0');
-
-        document.getElementById('totalProfit').innerText = (totalPnL >= 0 ? '+$' : '-$') + Math.abs(totalPnL).toLocaleString();
-        document.getElementById('totalProfit').style.color = totalPnL >= 0 ? '#27ae60' : '#c0392b';
-        document.getElementById('totalR').innerText = totalR.toFixed(1) + 'R';
-        document.getElementById('winRate').innerText = winRate;
-        document.getElementById('pf').innerText = pf;
-
-        const tbody = document.getElementById('tableBody');
-        tbody.innerHTML = '';
-        [...trades].reverse().forEach(t => {
-            const tr = document.createElement('tr');
-            const resClass = t.result === '獲利' ? 'win-text' : (t.result === '虧損' ? 'loss-text' : '');
-            const money = (t.rValue * dollarPerR).toFixed(0);
-            const dateStr = t.time ? t.time.slice(5, 16).replace('T', ' ') : '-';
-            const imgIcon = t.img ? `<span class="img-icon" onclick="showImg('${t.img}')">📷</span>` : '-';
-            
-            tr.innerHTML = `
-                <td style="font-size:12px; color:#999">${dateStr}</td>
-                <td>${imgIcon}</td>
-                <td>
-                    <div style="font-weight:600">${t.method}</div>
-                    <div style="font-size:11px; color:#999">${t.context.split('(')[0]}</div>
-                </td>
-                <td class="${resClass}">${t.result}</td>
-                <td>
-                    <div class="${resClass}">${t.rValue}R</div>
-                    <div style="font-size:11px; color:#666">$${money}</div>
-                </td>
-                <td><button onclick="delTrade(${t.id})" style="background:none; color:#ccc;">✖</button></td>
-            `;
-            tbody.appendChild(tr);
-        });
-
-        updateCharts(dollarPerR);
-        renderHeatmap();
-    }
+    # 背景工作：查詢、列出、取消
+    def get_job(self, job_id):
+        job = self._jobs.get(job_id)
+        return json.dumps(job.snapshot() if job else {"id": job_id, "status": "unknown"}, ensure_ascii=False)
 
-    function updateCharts(dollarPerR) {
-        let acc = 0;
-        const eqData = trades.map(t => acc += t.rValue * dollarPerR);
-        renderChart('equityChart', 'line', trades.map((_, i) => i+1), eqData, '#2980b9');
+    def list_jobs(self):
+        return json.dumps(self._jobs.list(), ensure_ascii=False)
 
-        const hourPnL = new Array(24).fill(0);
-        trades.forEach(t => {
-            if(t.time) {
-                const h = new Date(t.time).getHours();
-                hourPnL[h] += t.rValue * dollarPerR;
-            }
-        });
-        const hours = Array.from({length:24}, (_, i) => i + ":00");
-        renderChart('hourChart', 'bar', hours, hourPnL, hourPnL.map(v=>v>=0?'#27ae60':'#c0392b'));
-
-        const ctxPnL = {};
-        trades.forEach(t => {
-            const c = t.context.split('(')[0];
-            if(!ctxPnL[c]) ctxPnL[c] = 0;
-            ctxPnL[c] += t.rValue * dollarPerR;
-        });
-        renderChart('contextChart', 'bar', Object.keys(ctxPnL), Object.values(ctxPnL), Object.values(ctxPnL).map(v=>v>=0?'#27ae60':'#c0392b'), 'y');
-    }
+    def cancel_job(self, job_id):
+        return "ok" if self._jobs.cancel(job_id) else "not found"
 
-    function renderChart(id, type, labels, data, colors, indexAxis='x') {
-        if(chartInstances[id]) chartInstances[id].destroy();
-        chartInstances[id] = new Chart(document.getElementById(id), {
-            type: type,
-            data: {
-                labels: labels,
-                datasets: [{ 
-                    data: data, 
-                    backgroundColor: colors, 
-                    borderColor: '#2980b9', 
-                    tension: 0.1, 
-                    fill: type==='line' 
-                }]
-            },
-            options: {
-                responsive: true, 
-                maintainAspectRatio: false, 
-                indexAxis: indexAxis,
-                plugins: { legend: {display:false} },
-                scales: { x: {display: indexAxis!=='y'}, y: {display: indexAxis!=='x'} }
-            }
-        });
-    }
+    # 進度推送給前端 window.onJobEvent；視窗還沒建立或已關閉時略過，前端仍可輪詢 get_job
+    def _push_job(self, snapshot):
+        if self._window is not None:
+            self._window.evaluate_js(f"window.onJobEvent && window.onJobEvent({json.dumps(snapshot, ensure_ascii=False)})")
 
-    function renderHeatmap() {
-        const container = document.getElementById('heatmapContainer');
-        const contexts = ["強趨勢 (Strong Trend)", "交易區間 (Trading Range)", "寬通道 (Broad Channel)", "窄通道 (Tight Channel)", "突破模式 (Breakout Mode)", "高潮 (Climax)"];
-        const matrix = {};
-        contexts.forEach(c => {
-            matrix[c] = {};
-            methods.forEach(m => matrix[c][m] = { wins: 0, total: 0 });
-        });
-
-        trades.forEach(t => {
-            const matchedCtx = contexts.find(c => c === t.context) || t.context;
-            if(matrix[matchedCtx] && matrix[matchedCtx][t.method]) {
-                matrix[matchedCtx][t.method].total++;
-                if(t.result === '獲利') matrix[matchedCtx][t.method].wins++;
-            }
-        });
-
-        let html = '<table class="heatmap-table"><tr class="heatmap-header-row"><th>背景 \\ 策略</th>';
-        methods.forEach(m => html += `<th>${m}</th>`);
-        html += '</tr>';
-
-        contexts.forEach(ctx => {
-            const shortCtx = ctx.split('(')[0];
-            html += `<tr><th>${shortCtx}</th>`;
-            methods.forEach(m => {
-                const data = matrix[ctx] && matrix[ctx][m] ? matrix[ctx][m] : {wins:0, total:0};
-                let bg = '#fff';
-                let text = '-';
-                if (data.total > 0) {
-                    const rate = (data.wins / data.total * 100).toFixed(0);
-                    text = `${rate}% <span style="font-size:10px; opacity:0.6">(${data.total})</span>`;
-                    if (rate >= 60) bg = '#d4edda';
-                    else if (rate >= 40) bg = '#fff3cd';
-                    else bg = '#f8d7da';
-                }
-                html += `<td style="background:${bg}">${text}</td>`;
-            });
-            html += '</tr>';
-        });
-        html += '</table>';
-        container.innerHTML = html;
-    }
-</script>
-</body>
-</html>
-"""
 
 if __name__ == '__main__':
+    # PyInstaller 打包後子行程 (蒙地卡羅) 需要
+    multiprocessing.freeze_support()
     if getattr(sys, 'frozen', False):
         app_path = os.path.dirname(sys.executable)
     else:
         app_path = os.path.dirname(os.path.abspath(__file__))
 
     api = Api(app_path)
-    webview.create_window('Trading Journal V6.1', html=HTML_CODE, width=1400, height=900, js_api=api)
+    window = webview.create_window('Trading Journal V6.1', url=api.get_app_url(), width=1400, height=900, js_api=api)
+    api._window = window
+    window.events.shown += lambda: api._mark('shown')
+    window.events.closing += api.flush
     webview.start()
+    api._shutdown()
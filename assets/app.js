@@ -0,0 +1,777 @@
+let methods = [];
+let currentImgFile = null;
+let chartInstances = {};
+// 頁面與圖片由同一個本機伺服器提供，媒體根目錄直接由網址推得，不必等 API 往返
+let mediaBase = location.href.replace(/\/assets\/[^\/]*$/, '');
+
+// 頁面骨架先畫出來，資料在 API 就緒後才載入
+window.addEventListener('pywebviewready', () => {
+    loadData().then(reportStartup);
+    loadMethods();
+    const now = new Date();
+    now.setMinutes(now.getMinutes() - now.getTimezoneOffset());
+    document.getElementById('tradeTime').value = now.toISOString().slice(0,16);
+});
+
+document.addEventListener('paste', e => {
+    const items = e.clipboardData.items;
+    for (let i = 0; i < items.length; i++) {
+        if (items[i].type.indexOf('image') !== -1) {
+            const blob = items[i].getAsFile();
+            handleFile(blob);
+        }
+    }
+});
+
+// 預覽用 object URL，不把整張圖讀成 data URL
+function handleFile(file) {
+    if(!file) return;
+    currentImgFile = file;
+    const img = document.getElementById('preview');
+    if (img.src.startsWith('blob:')) URL.revokeObjectURL(img.src);
+    img.src = URL.createObjectURL(file);
+    img.style.display = 'block';
+}
+
+// 分段上傳：每段為 3 的倍數位元組，base64 不會跨段，後端可逐段解碼寫檔
+const UPLOAD_CHUNK = 3 * 256 * 1024;
+
+function toBase64(bytes) {
+    let bin = '';
+    for (let i = 0; i < bytes.length; i += 0x8000) {
+        bin += String.fromCharCode.apply(null, bytes.subarray(i, i + 0x8000));
+    }
+    return btoa(bin);
+}
+
+async function uploadImage(file) {
+    const id = await pywebview.api.begin_image_upload();
+    for (let pos = 0; pos < file.size; pos += UPLOAD_CHUNK) {
+        const bytes = new Uint8Array(await file.slice(pos, pos + UPLOAD_CHUNK).arrayBuffer());
+        const res = await pywebview.api.append_chunk(id, toBase64(bytes));
+        if (typeof res === 'string' && res.startsWith('error')) return res;
+    }
+    return pywebview.api.finish_image_upload(id);
+}
+
+// 前端不再持有整份交易：表格分頁查詢，統計與圖表都向後端要結果
+function loadData() {
+    return Promise.all([resetTable(), renderUI()]);
+}
+
+// 效能標記：量測同步或非同步 (Promise) 的區段，批次回報給後端 get_metrics() 一起統計
+let perfMarks = [];
+let perfTimer = null;
+
+function timed(name, fn) {
+    const start = performance.now();
+    const done = () => {
+        perfMarks.push({ name: name, start: start, duration: performance.now() - start });
+        if (!perfTimer) perfTimer = setTimeout(flushMarks, 2000);
+    };
+    const out = fn();
+    if (out && typeof out.finally === 'function') return out.finally(done);
+    done();
+    return out;
+}
+
+function flushMarks() {
+    perfTimer = null;
+    if (!perfMarks.length || !window.pywebview) return;
+    const marks = perfMarks;
+    perfMarks = [];
+    pywebview.api.report_marks(JSON.stringify({ timeOrigin: performance.timeOrigin, marks: marks }));
+}
+
+// 冷啟動計時：首次資料渲染完成後，把頁面端的時間點回報給後端記錄
+function reportStartup() {
+    const nav = performance.getEntriesByType('navigation')[0];
+    const paint = performance.getEntriesByType('paint').find(e => e.name === 'first-contentful-paint');
+    pywebview.api.report_startup(JSON.stringify({
+        timeOrigin: performance.timeOrigin,
+        domReady: nav ? nav.domContentLoadedEventEnd : null,
+        firstPaint: paint ? paint.startTime : null,
+        dataRendered: performance.now()
+    }));
+}
+
+function loadMethods() {
+    pywebview.api.load_methods().then(res => {
+        methods = JSON.parse(res);
+        renderMethodSelect();
+        renderHeatmap();
+    });
+}
+
+// 背景工作：後端以 window.onJobEvent 推送進度，另以低頻輪詢 get_job 補漏；結束時 resolve 最後狀態
+const jobWatchers = new Map();
+const JOB_DONE = ['done', 'failed', 'cancelled'];
+
+window.onJobEvent = job => {
+    const watcher = jobWatchers.get(job.id);
+    if (watcher) watcher(job);
+};
+
+function watchJob(id, onProgress) {
+    return new Promise(resolve => {
+        let poll = null;
+        const handle = job => {
+            if (onProgress) onProgress(job);
+            if (!JOB_DONE.includes(job.status)) return;
+            jobWatchers.delete(id);
+            clearInterval(poll);
+            resolve(job);
+        };
+        jobWatchers.set(id, handle);
+        poll = setInterval(() => pywebview.api.get_job(id).then(res => jobWatchers.has(id) && handle(JSON.parse(res))), 1000);
+    });
+}
+
+// 在標頭狀態列顯示進度；點一下可取消
+function jobStatus(label) {
+    const status = document.getElementById('importStatus');
+    return job => {
+        const pct = job.total ? ` ${Math.floor(job.done / job.total * 100)}%` : '';
+        status.innerText = JOB_DONE.includes(job.status) ? '' : `${label}${pct} ✕`;
+        status.onclick = () => pywebview.api.cancel_job(job.id);
+    };
+}
+
+async function runExport(idPromise, label) {
+    const id = await idPromise;
+    if (id.startsWith('error')) { alert(id); return; }
+    const job = await watchJob(id, jobStatus(label));
+    if (job.status === 'done') alert(job.result);
+    else if (job.status === 'failed') alert(job.error);
+}
+
+function exportCSV() {
+    runExport(pywebview.api.export_csv(), '匯出 CSV');
+}
+
+function exportParquet() {
+    runExport(pywebview.api.export_columnar('parquet'), '匯出 Parquet');
+}
+
+// 備份：增量快照，只含上次備份後變動的交易與新圖片
+function backupData() {
+    runExport(pywebview.api.create_backup(), '備份中');
+}
+
+// 還原：列出快照讓使用者輸入編號，還原完成後整頁資料重新載入
+async function restoreBackup() {
+    const list = JSON.parse(await pywebview.api.list_backups());
+    if (list.error) { alert(list.error); return; }
+    if (!list.length) { alert('還沒有備份'); return; }
+    const lines = list.map(s => `#${s.id}  ${s.created}  ${s.full ? '完整' : '增量'}  ${s.total} 筆`).join('\n');
+    const id = prompt(`輸入要還原的快照編號:\n${lines}`, list[list.length - 1].id);
+    if (!id || !confirm(`還原到快照 #${id}？目前的資料會被取代`)) return;
+    const jobId = await pywebview.api.restore_backup(id);
+    if (jobId.startsWith('error')) { alert(jobId); return; }
+    const job = await watchJob(jobId, jobStatus('還原中'));
+    if (job.status === 'done') {
+        resetTable();
+        renderUI();
+        loadMethods();
+        alert(job.result);
+    } else if (job.status === 'failed') alert(job.error);
+}
+
+// 批次匯入：選檔 → 背景匯入 (進度由工作事件推送) → 完成後確認是否保留
+async function importTrades() {
+    const path = await pywebview.api.choose_import_file();
+    if (!path) return;
+    const mapping = prompt('欄位對應 (JSON，例如 {"Symbol Setup": "method"})，留空自動對應:', '') || '{}';
+    const id = await pywebview.api.import_trades(path, mapping);
+    if (id.startsWith('error')) { alert(id); return; }
+
+    const job = await watchJob(id, jobStatus('匯入中'));
+    const p = job.info;
+    if (job.status === 'failed') {
+        alert(`匯入失敗，已全部撤回: ${job.error}`);
+    } else if (job.status === 'cancelled') {
+        alert('已取消匯入，已全部撤回');
+    } else if (!confirm(`已匯入 ${p.inserted} 筆，略過重複 ${p.skipped} 筆。\n保留這次匯入？ (取消 = 復原)`)) {
+        await pywebview.api.rollback_import(id);
+    }
+    loadData();
+}
+
+function renderMethodSelect() {
+    const sel = document.getElementById('method');
+    const current = sel.value;
+    sel.innerHTML = '';
+    methods.forEach(m => {
+        const opt = document.createElement('option');
+        opt.value = m;
+        opt.textContent = m;
+        sel.appendChild(opt);
+    });
+    if(methods.includes(current)) sel.value = current;
+
+    const filter = document.getElementById('filterMethod');
+    const currentFilter = filter.value;
+    filter.innerHTML = '<option value="">全部</option>';
+    methods.forEach(m => {
+        const opt = document.createElement('option');
+        opt.value = m;
+        opt.textContent = m;
+        filter.appendChild(opt);
+    });
+    filter.value = methods.includes(currentFilter) ? currentFilter : '';
+}
+
+function addMethod() {
+    const m = prompt("新策略名稱:");
+    if (m && !methods.includes(m)) {
+        methods.push(m);
+        pywebview.api.save_methods(JSON.stringify(methods));
+        renderMethodSelect();
+        renderHeatmap();
+    }
+}
+
+function delMethod() {
+    const m = document.getElementById('method').value;
+    if(confirm(`刪除 ${m}?`)) {
+        methods = methods.filter(i => i!==m);
+        pywebview.api.save_methods(JSON.stringify(methods));
+        renderMethodSelect();
+        renderHeatmap();
+    }
+}
+
+function updateR() {
+    const res = document.getElementById('result').value;
+    const rInput = document.getElementById('rValue');
+    if (res === '虧損') rInput.value = -1.0;
+    else if (res === '打平') rInput.value = 0.0;
+    else if (parseFloat(rInput.value) <= 0) rInput.value = 2.0;
+}
+
+function addTrade() {
+    const res = document.getElementById('result').value;
+    let r = parseFloat(document.getElementById('rValue').value);
+    if (res === '虧損' && r > 0) r = -r;
+    if (res === '虧損' && r === 0) r = -1.0;
+    if (res === '打平') r = 0.0;
+
+    // 儲存邏輯
+    const processTrade = (savedImgName) => {
+        const trade = {
+            id: Date.now(),
+            time: document.getElementById('tradeTime').value,
+            img: savedImgName || "",
+            context: document.getElementById('context').value,
+            method: document.getElementById('method').value,
+            trade_type: document.getElementById('type').value,
+            emotion: document.getElementById('emotion').value,
+            result: res,
+            rValue: r,
+            remark: document.getElementById('remark').value
+        };
+        // 寫入失敗 (例如 id 重複) 時不動表格，表單也保留讓使用者重送
+        pywebview.api.add_trade(JSON.stringify(trade)).then(result => {
+            if (typeof result === 'string' && result.startsWith('error')) {
+                alert("儲存失敗: " + result);
+                return;
+            }
+            patchTableAdd(trade);
+            renderUI();
+
+            currentImgFile = null;
+            const preview = document.getElementById('preview');
+            if (preview.src.startsWith('blob:')) URL.revokeObjectURL(preview.src);
+            preview.style.display = 'none';
+            preview.removeAttribute('src');
+            document.getElementById('remark').value = "";
+        });
+    };
+
+    if(currentImgFile) {
+        uploadImage(currentImgFile).then(savedName => {
+            if (savedName.startsWith('error')) {
+                alert("圖片上傳失敗: " + savedName);
+                savedName = "";
+            }
+            processTrade(savedName);
+        });
+    } else {
+        processTrade("");
+    }
+}
+
+function delTrade(id) {
+    if(confirm('刪除?')) {
+        // 刪除失敗 (或交易已不存在) 時表格可能已過期，提示後整個重新查詢
+        pywebview.api.delete_trade(id).then(result => {
+            if (result !== 'ok') {
+                alert("刪除失敗: " + result);
+                resetTable();
+                return;
+            }
+            patchTableDelete(id);
+            renderUI();
+        });
+    }
+}
+
+function clearAllData() {
+    if(confirm('清空?')) { pywebview.api.save_data('[]').then(() => { resetTable(); renderUI(); }); }
+}
+
+// 匯入的資料可能含有 HTML，插入 innerHTML 前一律跳脫
+const ESC = { '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' };
+function esc(value) {
+    return String(value ?? '').replace(/[&<>"']/g, ch => ESC[ch]);
+}
+
+function imgUrl(filename) {
+    return `${mediaBase}/images/${encodeURI(filename)}`;
+}
+
+function thumbUrl(filename) {
+    return `${mediaBase}/thumbs/${encodeURI(filename)}`;
+}
+
+// 縮圖產生失敗 (例如非圖片檔) 時退回原本的 📷 圖示
+function thumbFailed(el) {
+    const icon = document.createElement('span');
+    icon.className = 'img-icon';
+    icon.textContent = '📷';
+    icon.onclick = el.onclick;
+    el.replaceWith(icon);
+}
+
+// 圖片直接以 URL 載入，由本機伺服器串流，不經 Base64
+function showImg(filename) {
+    if(!filename) return;
+    const img = document.getElementById('popupImg');
+    img.onload = () => {
+        document.querySelector('.overlay').style.display = 'block';
+        document.getElementById('popup').style.display = 'block';
+    };
+    img.onerror = () => {
+        if (img.getAttribute('src')) alert("圖片讀取失敗 (可能已刪除)");
+    };
+    img.src = imgUrl(filename);
+}
+
+function closeImg() {
+    document.querySelector('.overlay').style.display = 'none';
+    document.getElementById('popup').style.display = 'none';
+    document.getElementById('popupImg').removeAttribute('src');
+}
+
+// 統計由後端增量維護，這裡只取摘要
+function renderStats(dollarPerR) {
+    return pywebview.api.get_summary(dollarPerR).then(res => {
+        const s = JSON.parse(res);
+        const winRate = s.total > 0 ? (s.winRate * 100).toFixed(0) + '%' : '0%';
+        const pf = s.pf === null ? '∞' : (s.grossLoss > 0 ? s.pf.toFixed(2) : '0.0');
+
+        document.getElementById('totalProfit').innerText = (s.totalPnL >= 0 ? '+$' : '-$') + Math.abs(s.totalPnL).toLocaleString();
+        document.getElementById('totalProfit').style.color = s.totalPnL >= 0 ? '#27ae60' : '#c0392b';
+        document.getElementById('totalR').innerText = s.totalR.toFixed(1) + 'R';
+        document.getElementById('winRate').innerText = winRate;
+        document.getElementById('pf').innerText = pf;
+    });
+}
+
+// 虛擬化表格：資料由後端分頁查詢，只渲染捲動視窗內的列；列元素依 id 重用
+// ROW_H 須與 app.css 中 tr.trade-row 的固定列高一致
+const ROW_H = 57, OVERSCAN = 10, PAGE = 100;
+let table = { total: 0, rows: [], els: new Map(), sort: '-seq', version: 0, pending: new Set(), dollarPerR: null };
+
+function tableFilters() {
+    const f = {};
+    const m = document.getElementById('filterMethod').value;
+    const r = document.getElementById('filterResult').value;
+    if (m) f.method = m;
+    if (r) f.result = r;
+    const start = document.getElementById('filterStart').value;
+    const end = document.getElementById('filterEnd').value;
+    if (start) f.start = start;
+    if (end) f.end = end;
+    const q = document.getElementById('searchBox').value.trim();
+    if (q) f.q = q;
+    return f;
+}
+
+// 搜尋框輸入停頓後才重新查詢
+let searchTimer = null;
+function onSearchInput() {
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(resetTable, 150);
+}
+
+function resetTable() {
+    table.version++;
+    table.total = 0;
+    table.rows = [];
+    table.els.clear();
+    table.pending.clear();
+    document.getElementById('tableScroll').scrollTop = 0;
+    return fetchRows(0);
+}
+
+function fetchRows(offset) {
+    offset = Math.floor(offset / PAGE) * PAGE;
+    if (table.pending.has(offset)) return;
+    table.pending.add(offset);
+    const version = table.version;
+    return pywebview.api.query_trades(offset, PAGE, JSON.stringify(tableFilters()), table.sort).then(res => {
+        if (version !== table.version) return;
+        table.pending.delete(offset);
+        const page = JSON.parse(res);
+        if (page.error) return;
+        table.total = page.total;
+        page.rows.forEach((t, i) => table.rows[offset + i] = t);
+        renderTable();
+    });
+}
+
+// 新增的交易若符合目前篩選，直接插到最前面，不重新查詢
+function patchTableAdd(trade) {
+    const { start, end, q, ...f } = tableFilters();
+    // 全文搜尋的比對規則在後端 (FTS)，交給後端重新查詢
+    if (q) return resetTable();
+    if (Object.keys(f).some(k => trade[k] !== f[k])) return;
+    // 日期區間以交易時間的日期部分比較；結束日當天也算在內，沒有時間的交易不符合
+    const day = (trade.time || '').slice(0, 10);
+    if ((start || end) && !day) return;
+    if ((start && day < start) || (end && day > end)) return;
+    // 位移後進行中的分頁結果已對不上索引，丟棄後再補抓
+    table.version++;
+    table.pending.clear();
+    table.rows.unshift(trade);
+    table.total++;
+}
+
+function patchTableDelete(id) {
+    const idx = table.rows.findIndex(t => t && t.id === id);
+    if (idx < 0) return;
+    table.version++;
+    table.pending.clear();
+    table.rows.splice(idx, 1);
+    table.els.delete(id);
+    table.total--;
+}
+
+function buildRow(t, dollarPerR) {
+    const tr = document.createElement('tr');
+    tr.className = 'trade-row';
+    const resClass = t.result === '獲利' ? 'win-text' : (t.result === '虧損' ? 'loss-text' : '');
+    const money = (t.rValue * dollarPerR).toFixed(0);
+    const dateStr = t.time ? t.time.slice(5, 16).replace('T', ' ') : '-';
+    const imgIcon = t.img ? `<img class="img-thumb" loading="lazy" src="${esc(thumbUrl(t.img))}" onerror="thumbFailed(this)">` : '-';
+
+    tr.innerHTML = `
+        <td style="font-size:12px; color:#999">${esc(dateStr)}</td>
+        <td>${imgIcon}</td>
+        <td>
+            <div style="font-weight:600">${esc(t.method)}</div>
+            <div style="font-size:11px; color:#999">${esc(t.context).split('(')[0]}</div>
+        </td>
+        <td class="${resClass}">${esc(t.result)}</td>
+        <td>
+            <div class="${resClass}">${esc(t.rValue)}R</div>
+            <div style="font-size:11px; color:#666">$${money}</div>
+        </td>
+        <td><button class="del-btn" style="background:none; color:#ccc;">✖</button></td>
+    `;
+    // id 可能是數字或字串 (匯入的交易)，直接綁定物件上的值，不經過 HTML 字串
+    tr.querySelector('.del-btn').onclick = () => delTrade(t.id);
+    const thumb = tr.querySelector('.img-thumb');
+    if (thumb) thumb.onclick = () => showImg(t.img);
+    return tr;
+}
+
+function spacerRow(height) {
+    const tr = document.createElement('tr');
+    tr.className = 'spacer';
+    tr.innerHTML = `<td colspan="6" style="height:${height}px"></td>`;
+    return tr;
+}
+
+function renderTable() {
+    const dollarPerR = parseFloat(document.getElementById('oneRValue').value) || 200;
+    if (dollarPerR !== table.dollarPerR) {
+        table.els.clear();
+        table.dollarPerR = dollarPerR;
+    }
+    const box = document.getElementById('tableScroll');
+    const start = Math.max(0, Math.floor(box.scrollTop / ROW_H) - OVERSCAN);
+    const end = Math.min(table.total, Math.ceil((box.scrollTop + box.clientHeight) / ROW_H) + OVERSCAN);
+
+    const visible = [spacerRow(start * ROW_H)];
+    const used = new Map();
+    for (let i = start; i < end; i++) {
+        const t = table.rows[i];
+        if (!t) {
+            fetchRows(i);
+            const placeholder = document.createElement('tr');
+            placeholder.className = 'trade-row';
+            placeholder.innerHTML = '<td colspan="6"></td>';
+            visible.push(placeholder);
+            continue;
+        }
+        const tr = table.els.get(t.id) || buildRow(t, dollarPerR);
+        used.set(t.id, tr);
+        visible.push(tr);
+    }
+    visible.push(spacerRow((table.total - end) * ROW_H));
+    // 只保留視窗內的列元素，捲走的讓 GC 回收
+    table.els = used;
+    document.getElementById('tableBody').replaceChildren(...visible);
+    document.getElementById('tableCount').innerText = `${table.total} 筆`;
+}
+
+// 蒙地卡羅：背景執行，輪詢部分結果並更新分位帶
+let mcRun = null;
+
+async function toggleMonteCarlo() {
+    if (mcRun) {
+        pywebview.api.cancel_monte_carlo(mcRun);
+        return;
+    }
+    const filters = {};
+    const f = tableFilters();
+    ['method', 'start', 'end'].forEach(k => { if (f[k]) filters[k] = f[k]; });
+    const id = await pywebview.api.run_monte_carlo(parseInt(document.getElementById('mcPaths').value) || 10000, 0,
+                                                   JSON.stringify(filters), document.getElementById('mcMode').value);
+    if (id.startsWith('error')) { alert(id); return; }
+    mcRun = id;
+    document.getElementById('mcButton').innerText = '取消';
+    let res;
+    while (true) {
+        const dollarPerR = parseFloat(document.getElementById('oneRValue').value) || 200;
+        res = JSON.parse(await pywebview.api.get_monte_carlo(id, dollarPerR));
+        if (res.band) renderMonteCarlo(res);
+        document.getElementById('mcStatus').innerText = `${res.paths}/${res.totalPaths} 路徑 · ${res.elapsed}s` +
+            (res.ending ? ` · 結束中位數 $${Math.round(res.ending[2]).toLocaleString()} · 回撤 95% $${Math.round(res.maxDrawdown[4]).toLocaleString()} · 虧損機率 ${(res.probLoss * 100).toFixed(1)}%` : '');
+        if (res.status !== 'running') break;
+        await new Promise(r => setTimeout(r, 300));
+    }
+    if (res.status === 'failed') alert(res.error);
+    mcRun = null;
+    document.getElementById('mcButton').innerText = '執行';
+}
+
+function renderMonteCarlo(res) {
+    const colors = ['#f5b7b1', '#aed6f1', '#2980b9', '#aed6f1', '#f5b7b1'];
+    const datasets = res.band.map((row, i) => ({
+        label: `P${res.percentiles[i]}`, data: row, borderColor: colors[i], pointRadius: 0, borderWidth: i === 2 ? 2 : 1, fill: false
+    }));
+    const existing = chartInstances.mcChart;
+    if (existing) {
+        existing.data.labels = res.steps;
+        datasets.forEach((ds, i) => existing.data.datasets[i].data = ds.data);
+        existing.update('none');
+        return;
+    }
+    chartInstances.mcChart = new Chart(document.getElementById('mcChart'), {
+        type: 'line',
+        data: { labels: res.steps, datasets: datasets },
+        options: { responsive: true, maintainAspectRatio: false, animation: false, plugins: { legend: { display: true, position: 'right' } } }
+    });
+}
+
+function renderRisk(dollarPerR) {
+    const windowSize = parseInt(document.getElementById('rollWindow').value) || 20;
+    return pywebview.api.get_risk_metrics(windowSize, dollarPerR).then(res => {
+        const m = JSON.parse(res);
+        if (!m.count) return;
+        document.getElementById('maxDD').innerHTML = `-${m.maxDrawdownR.toFixed(1)}R <span class="stat-sub">$${Math.round(m.maxDrawdown).toLocaleString()} · ${m.maxDrawdownTrades} 筆</span>`;
+        document.getElementById('expectancy').innerHTML = `${m.expectancy.toFixed(2)}R <span class="stat-sub">SQN ${m.sqn === null ? '-' : m.sqn.toFixed(2)}</span>`;
+        document.getElementById('streaks').innerText = `${m.longestWinStreak} / ${m.longestLossStreak}`;
+        document.getElementById('rollingLabel').innerText = `近 ${m.window} 筆勝率 / PF`;
+        if (m.rollingWinRate) {
+            const wr = m.rollingWinRate[m.rollingWinRate.length - 1];
+            const pf = m.rollingPF[m.rollingPF.length - 1];
+            document.getElementById('rolling').innerText = `${(wr * 100).toFixed(0)}% / ${pf === null ? '∞' : pf.toFixed(2)}`;
+        } else {
+            document.getElementById('rolling').innerText = '-';
+        }
+    });
+}
+
+function renderUI() {
+    return timed('renderUI', () => {
+        const dollarPerR = parseFloat(document.getElementById('oneRValue').value) || 200;
+        timed('renderTable', renderTable);
+        return Promise.all([renderStats(dollarPerR), renderRisk(dollarPerR), updateCharts(dollarPerR), renderHeatmap(), renderCalendar()]);
+    });
+}
+
+// 資金曲線、時段與背景損益都由後端欄式資料算好
+function updateCharts(dollarPerR) {
+    return timed('updateCharts', () => {
+        const width = document.getElementById('equityChart').clientWidth || 800;
+        return pywebview.api.get_chart_data(dollarPerR, width).then(res => timed('updateCharts.render', () => {
+            const d = JSON.parse(res);
+            // LTTB 留下的點在交易序號上不等距，以 {x, y} 畫在線性軸上才不會被拉成等距
+            const equity = d.equity.map((y, i) => ({x: d.equityX[i], y}));
+            renderChart('equityChart', 'line', null, equity, '#2980b9');
+
+            const hours = Array.from({length:24}, (_, i) => i + ":00");
+            renderChart('hourChart', 'bar', hours, d.hourly, d.hourly.map(v=>v>=0?'#27ae60':'#c0392b'));
+
+            const ctxLabels = d.context.labels.map(c => c.split('(')[0]);
+            renderChart('contextChart', 'bar', ctxLabels, d.context.values, d.context.values.map(v=>v>=0?'#27ae60':'#c0392b'), 'y');
+        }));
+    });
+}
+
+// 已有圖表時原地替換資料並以 update('none') 重繪，不重建實例
+// labels 為 null 時，data 是 {x, y} 點，x 軸改用線性刻度
+function renderChart(id, type, labels, data, colors, indexAxis='x') {
+    // 離線且本機 Chart.js 也缺時，只略過圖表，其餘介面照常
+    if (!window.Chart) return;
+    const existing = chartInstances[id];
+    if (existing) {
+        if (labels !== null) existing.data.labels = labels;
+        existing.data.datasets[0].data = data;
+        existing.data.datasets[0].backgroundColor = colors;
+        existing.update('none');
+        return;
+    }
+    chartInstances[id] = new Chart(document.getElementById(id), {
+        type: type,
+        data: {
+            labels: labels === null ? undefined : labels,
+            datasets: [{ 
+                data: data, 
+                backgroundColor: colors, 
+                borderColor: '#2980b9', 
+                tension: 0.1, 
+                pointRadius: type==='line' ? 0 : undefined,
+                fill: type==='line' 
+            }]
+        },
+        options: {
+            responsive: true, 
+            maintainAspectRatio: false, 
+            indexAxis: indexAxis,
+            plugins: { legend: {display:false} },
+            scales: {
+                x: labels === null ? {type: 'linear', display: true} : {display: indexAxis!=='y'},
+                y: {display: indexAxis!=='x'}
+            }
+        }
+    });
+}
+
+// 日曆損益：後端依日期桶累計，只取所選區間；顏色深淺依該桶損益相對最大值
+const CALENDAR_SPAN = { day: 90, week: 364, month: 0 };
+
+function renderCalendar() {
+    const granularity = document.getElementById('calendarGranularity').value;
+    const dollarPerR = parseFloat(document.getElementById('oneRValue').value) || 200;
+    let start = '';
+    if (CALENDAR_SPAN[granularity]) {
+        const d = new Date();
+        d.setDate(d.getDate() - CALENDAR_SPAN[granularity]);
+        start = `${d.getFullYear()}-${String(d.getMonth() + 1).padStart(2, '0')}-${String(d.getDate()).padStart(2, '0')}`;
+    }
+    return pywebview.api.get_calendar(start, '', granularity, dollarPerR).then(res => {
+        const c = JSON.parse(res);
+        const grid = document.getElementById('calendarGrid');
+        if (c.error) { grid.textContent = c.error; return; }
+        const peak = Math.max(1, ...c.buckets.map(b => Math.abs(b.pnl)));
+        grid.innerHTML = c.buckets.map(b => {
+            const alpha = 0.15 + 0.6 * Math.abs(b.pnl) / peak;
+            const bg = b.pnl >= 0 ? `rgba(39,174,96,${alpha})` : `rgba(192,57,43,${alpha})`;
+            const label = granularity === 'week' ? b.key.slice(5) + ' 週' : (granularity === 'day' ? b.key.slice(5) : b.key);
+            return `<div class="calendar-cell" style="background:${bg}" title="${esc(b.key)} · 勝 ${b.wins} / 敗 ${b.losses}">` +
+                   `<div>${esc(label)}</div><div class="calendar-pnl">${b.pnl >= 0 ? '+' : '-'}$${Math.abs(Math.round(b.pnl)).toLocaleString()}</div>` +
+                   `<div>${b.count} 筆</div></div>`;
+        }).join('') || '<div class="stat-sub">區間內沒有交易</div>';
+        document.getElementById('calendarTotal').innerText =
+            `${c.total.count} 筆 · ${c.total.pnl >= 0 ? '+' : '-'}$${Math.abs(Math.round(c.total.pnl)).toLocaleString()}`;
+    });
+}
+
+// 樞紐表：資料來自後端預先累計的格子，切換維度不需重掃交易
+const CONTEXTS = ["強趨勢 (Strong Trend)", "交易區間 (Trading Range)", "寬通道 (Broad Channel)", "窄通道 (Tight Channel)", "突破模式 (Breakout Mode)", "高潮 (Climax)"];
+const WEEKDAYS = ['一', '二', '三', '四', '五', '六', '日'];
+const PIVOT_DIMS = { context: '背景', method: '策略', emotion: '情緒', trade_type: '型態', hour: '時段', weekday: '星期' };
+
+function initPivotSelects() {
+    const fill = (id, value, allowNone) => {
+        const sel = document.getElementById(id);
+        sel.innerHTML = (allowNone ? '<option value="">(無)</option>' : '') +
+            Object.entries(PIVOT_DIMS).map(([k, v]) => `<option value="${k}">${v}</option>`).join('');
+        sel.value = value;
+    };
+    fill('pivotRow', 'context', false);
+    fill('pivotCol', 'method', false);
+    fill('pivotExtra', '', true);
+}
+
+// 背景與策略依既有清單排序，其餘依後端排序
+function pivotValues(dim, present) {
+    const known = dim === 'context' ? CONTEXTS : (dim === 'method' ? methods : null);
+    if (!known) return present;
+    return known.concat(present.filter(v => !known.includes(v)));
+}
+
+function pivotLabel(dim, v) {
+    if (v === null || v === '') return '-';
+    if (dim === 'context') return v.split('(')[0];
+    if (dim === 'hour') return v + ':00';
+    if (dim === 'weekday') return '週' + WEEKDAYS[v];
+    return v;
+}
+
+function renderHeatmap() {
+    return timed('renderHeatmap', () => {
+        const container = document.getElementById('heatmapContainer');
+        if (!document.getElementById('pivotRow').value) initPivotSelects();
+        const rowDim = document.getElementById('pivotRow').value;
+        const colDim = document.getElementById('pivotCol').value;
+        const extraDim = document.getElementById('pivotExtra').value;
+        const metric = document.getElementById('pivotMetric').value;
+        if (rowDim === colDim || extraDim === rowDim || extraDim === colDim) {
+            container.innerHTML = '<div class="stat-sub">請選擇不同的維度</div>';
+            return;
+        }
+        const dims = extraDim ? [rowDim, extraDim, colDim] : [rowDim, colDim];
+
+        return pywebview.api.get_pivot(JSON.stringify(dims)).then(res => timed('renderHeatmap.render', () => {
+            const p = JSON.parse(res);
+            if (p.error) { container.textContent = p.error; return; }
+            const cells = new Map(p.cells.map(c => [JSON.stringify(c.key), c]));
+            const rows = pivotValues(rowDim, p.values[0]);
+            const extras = extraDim ? p.values[1] : [null];
+            const cols = pivotValues(colDim, p.values[dims.length - 1]);
+
+            let html = `<table class="heatmap-table"><tr class="heatmap-header-row"><th>${PIVOT_DIMS[rowDim]}${extraDim ? ' / ' + PIVOT_DIMS[extraDim] : ''} \\ ${PIVOT_DIMS[colDim]}</th>`;
+            cols.forEach(c => html += `<th>${esc(pivotLabel(colDim, c))}</th>`);
+            html += '</tr>';
+
+            rows.forEach(r => extras.forEach(x => {
+                const prefix = extraDim ? [r, x] : [r];
+                if (extraDim && !cols.some(c => cells.has(JSON.stringify(prefix.concat([c]))))) return;
+                html += `<tr><th>${esc(pivotLabel(rowDim, r))}${extraDim ? ' / ' + esc(pivotLabel(extraDim, x)) : ''}</th>`;
+                cols.forEach(c => {
+                    const data = cells.get(JSON.stringify(prefix.concat([c])));
+                    let bg = '#fff';
+                    let text = '-';
+                    if (data) {
+                        const rate = (data.winRate * 100).toFixed(0);
+                        const value = metric === 'winRate' ? rate + '%' : (metric === 'avgR' ? data.avgR.toFixed(2) + 'R' : data.count);
+                        text = `${value} <span style="font-size:10px; opacity:0.6">(${data.count})</span>`;
+                        if (rate >= 60) bg = '#d4edda';
+                        else if (rate >= 40) bg = '#fff3cd';
+                        else bg = '#f8d7da';
+                    }
+                    html += `<td style="background:${bg}">${text}</td>`;
+                });
+                html += '</tr>';
+            }));
+            html += '</table>';
+            container.innerHTML = html;
+        }));
+    });
+}
@@ -0,0 +1,342 @@
+"""交易日誌效能基準：產生合成日誌 (1k / 100k / 1M 筆，可附圖片)，不開視窗直接呼叫 Api。
+
+每個規模在獨立子行程執行，峰值 RSS 不互相污染。輸出 JSON，可存檔後用 --compare 比較兩次結果。
+
+    python benchmark.py --sizes 1k,100k --images both --out bench.json
+    python benchmark.py --sizes 1m --images none --out big.json
+    python benchmark.py --compare old.json new.json
+"""
+import argparse
+import base64
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+try:
+    import resource
+except ImportError:
+    # Windows 沒有 getrusage，峰值 RSS 留空
+    resource = None
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "TradingPAT8_2.0.py")
+
+# 檔名含點號無法直接 import；註冊進 sys.modules，蒙地卡羅子行程才能依模組名稱還原函式
+_spec = importlib.util.spec_from_file_location("tradingpat", APP_FILE)
+tj = importlib.util.module_from_spec(_spec)
+sys.modules["tradingpat"] = tj
+_spec.loader.exec_module(tj)
+
+CONTEXTS = ["強趨勢 (Strong Trend)", "交易區間 (Trading Range)", "寬通道 (Broad Channel)",
+            "窄通道 (Tight Channel)", "突破模式 (Breakout Mode)", "高潮 (Climax)"]
+METHODS = ["三推底", "三推頂", "雙底", "雙頂", "突破有跟隨", "突破無跟隨", "TR", "重大趨勢反轉"]
+EMOTIONS = ["平靜", "急躁", "猶豫", "報復"]
+TYPES = ["Swing", "Scalp"]
+REMARK_WORDS = ["late", "entry", "early", "exit", "chase", "wedge", "pullback", "follow", "through",
+                "追高", "太早", "停損", "出場", "回測", "猶豫", "加碼", "假突破", "順勢", "逆勢"]
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+
+def peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 單位是 KB，macOS 是 bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def bytes_written():
+    # 行程 (含所有執行緒) 經 write() 送出的位元組數；只有 Linux 有 /proc
+    try:
+        with open("/proc/self/io") as f:
+            return int(next(line for line in f if line.startswith("wchar:")).split()[1])
+    except (OSError, StopIteration):
+        return None
+
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def synth_trade(i, rng, start, images=()):
+    r = round(rng.gauss(0.15, 1.4), 2)
+    return {
+        "id": f"bench-{i}",
+        "time": datetime.fromtimestamp(start + i * 1800).strftime("%Y-%m-%dT%H:%M"),
+        "img": images[i % len(images)] if images else "",
+        "context": rng.choice(CONTEXTS),
+        "method": rng.choice(METHODS),
+        "trade_type": rng.choice(TYPES),
+        "emotion": rng.choice(EMOTIONS),
+        "result": "獲利" if r > 0 else ("虧損" if r < 0 else "打平"),
+        "rValue": r,
+        "remark": " ".join(rng.choice(REMARK_WORDS) for _ in range(rng.randint(0, 10))),
+    }
+
+
+def synth_image(seed, size=(1280, 720)):
+    # 漸層加雜訊，壓縮後大小接近真實截圖 (數百 KB)
+    rng = np.random.default_rng(seed)
+    w, h = size
+    base = np.linspace(0, 255, w, dtype=np.float32)[None, :, None] * rng.random(3, dtype=np.float32)
+    noise = rng.normal(0, 24, (h, w, 3)).astype(np.float32)
+    pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+
+class Bench:
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.results = {}
+
+    # teardown(i) 在每次計時之後執行，不算進耗時
+    def measure(self, name, fn, repeat=1, teardown=None):
+        samples = []
+        error = None
+        wchar, disk, rss = bytes_written(), dir_size(self.data_dir), peak_rss()
+        for i in range(repeat):
+            t0 = time.perf_counter()
+            out = fn(i)
+            samples.append((time.perf_counter() - t0) * 1000)
+            if teardown is not None:
+                teardown(i)
+            if isinstance(out, str) and out.startswith("error"):
+                error = out
+        ms = np.array(samples)
+        entry = {
+            "n": repeat,
+            "meanMs": round(float(ms.mean()), 3),
+            "p50Ms": round(float(np.percentile(ms, 50)), 3),
+            "p90Ms": round(float(np.percentile(ms, 90)), 3),
+            "p99Ms": round(float(np.percentile(ms, 99)), 3),
+            "maxMs": round(float(ms.max()), 3),
+            "bytesWritten": None if wchar is None else bytes_written() - wchar,
+            "diskDelta": dir_size(self.data_dir) - disk,
+            "peakRssGrowth": None if rss is None else peak_rss() - rss,
+        }
+        if error:
+            entry["error"] = error
+        self.results[name] = entry
+        print(f"  {name:<28} p50 {entry['p50Ms']:>10.2f} ms   p99 {entry['p99Ms']:>10.2f} ms", file=sys.stderr)
+        return entry
+
+
+# 背景工作 (匯入/匯出/備份/蒙地卡羅) 直接等工作結束的事件，不輪詢，量到的時間不會被輪詢間隔量化
+def wait_job(api, job_id):
+    if job_id.startswith("error"):
+        return job_id
+    job = api._jobs.get(job_id)
+    if job is None:
+        return f"error: unknown job {job_id}"
+    job.wait()
+    return "ok" if job.status == "done" else f"error: {job.status} {job.error}"
+
+
+def run_worker(n, with_images, repeat, heavy_repeat, result_file):
+    data_dir = tempfile.mkdtemp(prefix="tj-bench-")
+    rng = random.Random(n)
+    start = time.mktime((2023, 1, 2, 9, 0, 0, 0, 0, -1))
+    try:
+        api = tj.Api(data_dir)
+        bench = Bench(data_dir)
+        heavy = heavy_repeat if n <= 100_000 else 1
+
+        images = []
+        if with_images:
+            blobs = [synth_image(i) for i in range(max(1, min(n // 20, 200)))]
+            encoded = ["data:image/jpeg;base64," + base64.b64encode(b).decode() for b in blobs]
+            bench.measure("save_image", lambda i: images.append(api.save_image(encoded[i])) or images[-1], len(encoded))
+            chunk = 3 * 256 * 1024
+            # 圖片先產生好，計時只涵蓋上傳本身
+            uploads = [synth_image(10_000 + i) for i in range(min(repeat, 20))]
+            def upload(i):
+                upload_id = api.begin_image_upload()
+                data = uploads[i]
+                for off in range(0, len(data), chunk):
+                    api.append_chunk(upload_id, base64.b64encode(data[off:off + chunk]).decode())
+                return api.finish_image_upload(upload_id)
+            bench.measure("image_upload_chunked", upload, min(repeat, 20))
+            bench.measure("get_image_base64", lambda i: api.get_image_base64(images[i % len(images)]), repeat)
+            bench.measure("get_image_url", lambda i: api.get_image_url(images[i % len(images)]), repeat)
+
+        journal = os.path.join(data_dir, "journal.jsonl")
+        with open(journal, "w", encoding="utf-8") as f:
+            for i in range(n):
+                f.write(json.dumps(synth_trade(i, rng, start, images), ensure_ascii=False) + "\n")
+        bench.measure("import_trades", lambda i: wait_job(api, api.import_trades(journal)))
+        os.remove(journal)
+        api.flush()
+
+        opened = []
+        def cold_start(i):
+            opened.append(tj.Api(data_dir))
+            # get_summary 要等背景重建完成才拿得到鎖
+            return opened[-1].get_summary()
+        # 每個實例的執行緒池、寫入執行緒與啟動時排的回收工作在計時後收掉，不影響後面的量測
+        bench.measure("cold_start", cold_start, heavy, teardown=lambda i: opened.pop()._shutdown())
+
+        bench.measure("get_summary", lambda i: api.get_summary(200), repeat)
+        bench.measure("get_chart_data", lambda i: api.get_chart_data(200, 1200), repeat)
+        bench.measure("get_risk_metrics", lambda i: api.get_risk_metrics(20, 200), repeat)
+        bench.measure("get_calendar_day", lambda i: api.get_calendar("", "", "day", 200), repeat)
+        bench.measure("get_calendar_month", lambda i: api.get_calendar("", "", "month", 200), repeat)
+        bench.measure("get_storage_report", lambda i: api.get_storage_report(), repeat)
+        bench.measure("query_trades_date_range", lambda i: api.query_trades(0, 100, json.dumps({"start": "2023-06-01", "end": "2023-06-30"}), "time"), repeat)
+        bench.measure("get_pivot_2d", lambda i: api.get_pivot('["context", "method"]'), repeat)
+        bench.measure("get_pivot_3d", lambda i: api.get_pivot('["method", "emotion", "hour"]'), repeat)
+        bench.measure("query_trades_first_page", lambda i: api.query_trades(0, 100), repeat)
+        bench.measure("query_trades_deep_page", lambda i: api.query_trades(n // 2, 100), repeat)
+        bench.measure("query_trades_filtered", lambda i: api.query_trades(0, 100, json.dumps({"method": METHODS[i % len(METHODS)]}), "-rValue"), repeat)
+        bench.measure("count_trades_filtered", lambda i: api.count_trades(json.dumps({"result": "獲利"})), repeat)
+        bench.measure("search_word", lambda i: api.search(REMARK_WORDS[i % len(REMARK_WORDS)], 50), repeat)
+        bench.measure("search_phrase", lambda i: api.search("late entry 追高", 50), repeat)
+        bench.measure("query_trades_search", lambda i: api.query_trades(0, 100, json.dumps({"q": "假突破"}, ensure_ascii=False)), repeat)
+        bench.measure("get_trade", lambda i: api.get_trade(f"bench-{rng.randrange(n)}"), repeat)
+
+        new = [synth_trade(n + i, rng, start) for i in range(repeat)]
+        bench.measure("add_trade", lambda i: api.add_trade(json.dumps(new[i], ensure_ascii=False)), repeat)
+        bench.measure("update_trade", lambda i: api.update_trade(json.dumps(dict(new[i], rValue=-1.0, result="虧損"), ensure_ascii=False)), repeat)
+        bench.measure("delete_trade", lambda i: api.delete_trade(new[i]["id"]), repeat)
+        bench.measure("save_methods", lambda i: api.save_methods(json.dumps(METHODS + [f"m{i}"], ensure_ascii=False)), repeat)
+        bench.measure("flush", lambda i: api.flush(), 1)
+
+        bench.measure("run_monte_carlo_10k", lambda i: wait_job(api, api.run_monte_carlo(10_000, 0)), heavy)
+        bench.measure("export_csv", lambda i: wait_job(api, api.export_csv()), heavy)
+        if tj.pa is not None:
+            bench.measure("export_parquet", lambda i: wait_job(api, api.export_columnar("parquet")), heavy)
+        bench.measure("create_backup_full", lambda i: wait_job(api, api.create_backup()), 1)
+        def backup_incremental(i):
+            api.add_trade(json.dumps(synth_trade(n + 10_000 + i, rng, start), ensure_ascii=False))
+            return wait_job(api, api.create_backup())
+        bench.measure("create_backup_incremental", backup_incremental, heavy)
+        snapshot = {}
+        bench.measure("load_data", lambda i: snapshot.update(data=api.load_data()), heavy)
+        # save_data 呼叫者在等，背景寫入會立即提交 (不經防抖)，量到的是整份覆寫本身
+        bench.measure("save_data", lambda i: api.save_data(snapshot["data"]), heavy)
+
+        api._shutdown()
+        result = {
+            "trades": n,
+            "images": len(images),
+            "peakRss": peak_rss(),
+            "diskBytes": dir_size(data_dir),
+            "ops": bench.results,
+        }
+        with open(result_file, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def git_revision():
+    try:
+        cwd = os.path.dirname(APP_FILE)
+        rev = subprocess.run(["git", "rev-parse", "HEAD"], cwd=cwd, capture_output=True, text=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=cwd,
+                                    capture_output=True, text=True).stdout.strip())
+        return rev or None, dirty
+    except OSError:
+        return None, None
+
+
+def compare(old_file, new_file):
+    with open(old_file, encoding="utf-8") as f:
+        old = {(r["trades"], r["images"] > 0): r for r in json.load(f)["runs"]}
+    with open(new_file, encoding="utf-8") as f:
+        new = json.load(f)["runs"]
+    for run in new:
+        base = old.get((run["trades"], run["images"] > 0))
+        if base is None:
+            continue
+        print(f"\n{run['trades']:,} 筆{' (含圖片)' if run['images'] else ''}")
+        for op, entry in run["ops"].items():
+            if op not in base["ops"]:
+                continue
+            before, after = base["ops"][op]["p50Ms"], entry["p50Ms"]
+            ratio = after / before if before else float("inf")
+            print(f"  {op:<28} {before:>10.2f} → {after:>10.2f} ms  ×{ratio:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1k,100k", help="交易筆數，逗號分隔 (例：1k,100k,1m)")
+    parser.add_argument("--images", choices=("none", "with", "both"), default="both")
+    parser.add_argument("--repeat", type=int, default=50, help="輕量操作的取樣次數")
+    parser.add_argument("--heavy-repeat", type=int, default=3, help="整表操作 (匯出、整份讀寫) 的取樣次數；1M 筆固定 1 次")
+    parser.add_argument("--out", help="結果 JSON 路徑 (預設輸出到 stdout)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="比較兩份結果的 p50")
+    parser.add_argument("--worker", nargs=2, metavar=("SIZE", "RESULT"), help=argparse.SUPPRESS)
+    parser.add_argument("--with-images", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        return compare(*args.compare)
+    if args.worker:
+        return run_worker(int(args.worker[0]), args.with_images, args.repeat, args.heavy_repeat, args.worker[1])
+
+    variants = {"none": [False], "with": [True], "both": [False, True]}[args.images]
+    revision, dirty = git_revision()
+    report = {
+        "schema": 1,
+        "commit": revision,
+        "dirty": dirty,
+        "startedAt": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "runs": [],
+    }
+    for size in [parse_size(s) for s in args.sizes.split(",") if s.strip()]:
+        for with_images in variants:
+            print(f"{size:,} 筆{' (含圖片)' if with_images else ''}", file=sys.stderr)
+            fd, result_file = tempfile.mkstemp(suffix=".json")
+            os.close(fd)
+            try:
+                cmd = [sys.executable, os.path.abspath(__file__), "--worker", str(size), result_file,
+                       "--repeat", str(args.repeat), "--heavy-repeat", str(args.heavy_repeat)]
+                if with_images:
+                    cmd.append("--with-images")
+                started = time.perf_counter()
+                subprocess.run(cmd, check=True)
+                with open(result_file, encoding="utf-8") as f:
+                    run = json.load(f)
+                run["wallSeconds"] = round(time.perf_counter() - started, 2)
+                report["runs"].append(run)
+            finally:
+                os.remove(result_file)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()